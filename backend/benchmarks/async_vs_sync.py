@@ -0,0 +1,98 @@
+"""
+Throughput of the sync Flask app against the async ASGI variant.
+
+    python -m benchmarks.async_vs_sync --questions 10000 --concurrency 50
+
+Both apps run in-process against the same seeded SQLite file: the sync
+app through Flask test clients on a thread pool, the async app by calling
+the ASGI callable from concurrent tasks on one event loop. Prints JSON
+with requests per second for each route. The sync app's response body
+cache is switched off so both apps do the same database work.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flaskr import create_app
+from flaskr.asgi import create_async_app
+from .seed import seed_database
+
+ROUTES = [
+    ("GET", "/categories", b"", None),
+    ("GET", "/questions", b"page=50", None),
+    ("GET", "/categories/3/questions", b"", None),
+    ("POST", "/quizzes", b"", {"previous_questions": [],
+                               "quiz_category": {"type": "click", "id": 0}}),
+]
+
+
+def sync_throughput(app, method, path, query, body, requests, concurrency):
+    def call(_):
+        client = app.test_client()
+        return client.open(path, method=method, query_string=query.decode(),
+                           json=body).status_code
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        list(pool.map(call, range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+async def async_throughput(app, method, path, query, body, requests,
+                           concurrency):
+    content = json.dumps(body).encode() if body is not None else b""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async def receive():
+            return {"type": "http.request", "body": content}
+
+        async def send(message):
+            pass
+
+        async with limit:
+            await app({"type": "http", "method": method, "path": path,
+                       "query_string": query}, receive, send)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database = "sqlite:///" + os.path.join(directory, "trivia.db")
+    seed_database(database, args.questions)
+
+    sync_app = create_app({"SQLALCHEMY_DATABASE_URI": database})
+    async_app = create_async_app(database)
+
+    results = {}
+    for method, path, query, body in ROUTES:
+        name = "{} {}".format(method, path)
+        results[name] = {
+            "sync_rps": sync_throughput(sync_app, method, path, query, body,
+                                        args.requests, args.concurrency),
+            "async_rps": asyncio.run(async_throughput(
+                async_app, method, path, query, body, args.requests,
+                args.concurrency)),
+        }
+    print(json.dumps({"questions": args.questions,
+                      "concurrency": args.concurrency,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
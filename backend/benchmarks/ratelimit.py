@@ -0,0 +1,82 @@
+"""
+Overhead of the rate limiter.
+
+    python -m benchmarks.ratelimit --requests 5000 --clients 1000
+
+Times MemoryBucketStore.take() on its own, then GET /categories and the
+search branch of POST /questions through the Flask test client with the
+limiter off and on (with a limit high enough to admit every request),
+against a seeded SQLite file. Prints JSON with microseconds per call and
+the added latency per request.
+"""
+import argparse
+import json
+import os
+
+os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+import tempfile
+import time
+
+from flaskr import create_app
+from flaskr.ratelimit import MemoryBucketStore
+from .run import percentile
+from .seed import seed_database
+
+ROUTES = [
+    ("GET", "/categories", None),
+    ("POST", "/questions", {"searchTerm": "question 1"}),
+]
+
+
+def store_microseconds(calls, clients):
+    store = MemoryBucketStore()
+    keys = ["ip:10.0.{}.{}".format(i // 256, i % 256) for i in range(clients)]
+    started = time.perf_counter()
+    for i in range(calls):
+        store.take(keys[i % clients], 1, 1e9, 1e9)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def request_microseconds(app, method, path, body, requests, clients):
+    client = app.test_client()
+    latencies = []
+    for i in range(requests):
+        environ = {"REMOTE_ADDR": "10.0.{}.{}".format(
+            (i % clients) // 256, i % 256)}
+        started = time.perf_counter()
+        client.open(path, method=method, json=body, environ_base=environ)
+        latencies.append(time.perf_counter() - started)
+    return percentile(latencies, 0.5) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database = "sqlite:///" + os.path.join(directory, "trivia.db")
+    seed_database(database, args.questions)
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database})
+
+    results = {"store_take_us": store_microseconds(
+        args.requests * 10, args.clients)}
+    for method, path, body in ROUTES:
+        timings = {}
+        for limit in (None, 1e9):
+            app.config["RATE_LIMIT"] = limit
+            request_microseconds(app, method, path, body, 100, args.clients)
+            timings["on" if limit else "off"] = request_microseconds(
+                app, method, path, body, args.requests, args.clients)
+        timings["overhead_us"] = timings["on"] - timings["off"]
+        results["{} {}".format(method, path)] = timings
+
+    print(json.dumps({"questions": args.questions, "clients": args.clients,
+                      "p50_us": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Latency and throughput benchmarks for the Trivia API.
+
+    python -m benchmarks.run --questions 100k --output results.json
+    python -m benchmarks.run --questions 100k --compare results.json
+    python -m benchmarks.run --url http://localhost:5000 --threads 16
+
+Seeds a fresh SQLite database (or --database, e.g. a local PostgreSQL)
+and drives each scenario through the Flask test client, or over HTTP
+against a running server with --url. Prints JSON with latency
+percentiles (milliseconds) and throughput per scenario; --compare exits
+with status 1 when a scenario's p50 regressed by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .seed import parse_volume, seed_database
+
+QUESTIONS_PER_PAGE = 10
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        "requests": len(latencies),
+        "mean_ms": sum(milliseconds) / len(milliseconds),
+        "p50_ms": percentile(milliseconds, 0.50),
+        "p90_ms": percentile(milliseconds, 0.90),
+        "p99_ms": percentile(milliseconds, 0.99),
+        "max_ms": max(milliseconds),
+        "throughput_rps": len(latencies) / elapsed,
+    }
+
+
+class TestClientDriver:
+    """Calls the app in-process through Flask test clients."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, body=None):
+        response = self.app.test_client().open(path, method=method, json=body)
+        return json.loads(response.data)
+
+
+class HttpDriver:
+    """Calls a running server over HTTP."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=data, method=method,
+            headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+
+"""
+Scenarios
+    each returns a function taking the iteration number and performing
+    one request (or one create+delete pair) through the driver
+"""
+
+
+def scenarios(driver, total_questions):
+    last_page = max(1, -(-total_questions // QUESTIONS_PER_PAGE))
+    first = driver.request("GET", "/questions")
+    ids = [question["id"] for question in first.get("questions", [])]
+
+    deep_cursor = None
+    deep = driver.request("GET", "/questions?page={}".format(last_page - 1))
+    if deep.get("success"):
+        deep_cursor = deep.get("next_cursor")
+
+    def quiz(previous):
+        body = {"previous_questions": list(range(1, previous + 1)),
+                "quiz_category": {"type": "click", "id": 0}}
+        return lambda i: driver.request("POST", "/quizzes", body)
+
+    def create_delete(i):
+        created = driver.request("POST", "/questions", {
+            "question": "Benchmark write {}?".format(i), "answer": "Write",
+            "category": 1, "difficulty": 1})
+        driver.request("DELETE", "/questions/{}".format(created["created"]))
+
+    cases = {
+        "GET /questions page 1":
+            lambda i: driver.request("GET", "/questions?page=1"),
+        "GET /questions last page":
+            lambda i: driver.request(
+                "GET", "/questions?page={}".format(last_page)),
+        "GET /categories/<id>/questions":
+            lambda i: driver.request(
+                "GET", "/categories/{}/questions".format(i % 6 + 1)),
+        "POST /questions search":
+            lambda i: driver.request(
+                "POST", "/questions", {"searchTerm": "question {}".format(i)}),
+        "POST+DELETE /questions": create_delete,
+    }
+    for previous in (0, 10, 100, 1000, 10000):
+        # keep enough questions unasked for the quiz to find one
+        if previous <= total_questions // 2:
+            cases["POST /quizzes {} previous".format(previous)] = quiz(previous)
+    if deep_cursor:
+        cases["GET /questions last page (cursor)"] = lambda i: driver.request(
+            "GET", "/questions?cursor={}".format(deep_cursor))
+    if ids:
+        cases["GET /questions/<id>"] = lambda i: driver.request(
+            "GET", "/questions/{}".format(ids[i % len(ids)]))
+    return cases
+
+
+def measure(case, iterations, threads):
+    def timed(i):
+        started = time.perf_counter()
+        case(i)
+        return time.perf_counter() - started
+
+    case(0)  # warm caches before timing
+    started = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            latencies = list(pool.map(timed, range(iterations)))
+    else:
+        latencies = [timed(i) for i in range(iterations)]
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous and current["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append({
+                "scenario": name,
+                "baseline_p50_ms": previous["p50_ms"],
+                "p50_ms": current["p50_ms"],
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--questions", type=parse_volume, default=1000,
+                        help="number of questions to seed, or 1k/100k/1m")
+    parser.add_argument("--database",
+                        help="database URI to seed (default: temporary SQLite)")
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--only", help="run scenarios containing this text")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="keep the response body cache enabled")
+    parser.add_argument("--output", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.url:
+        driver = HttpDriver(args.url)
+        total_questions = driver.request("GET", "/questions")["total_questions"]
+    else:
+        if not args.response_cache:
+            os.environ["RESPONSE_CACHE_SIZE"] = "0"
+        import flaskr
+
+        database = args.database or "sqlite:///" + os.path.join(
+            tempfile.mkdtemp(), "trivia.db")
+        seed_database(database, args.questions)
+        driver = TestClientDriver(flaskr.create_app(
+            {"SQLALCHEMY_DATABASE_URI": database}))
+        total_questions = args.questions
+
+    results = {
+        "questions": total_questions,
+        "iterations": args.iterations,
+        "threads": args.threads,
+        "driver": "http" if args.url else "test_client",
+        "scenarios": {},
+    }
+    for name, case in scenarios(driver, total_questions).items():
+        if args.only and args.only not in name:
+            continue
+        results["scenarios"][name] = measure(case, args.iterations, args.threads)
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as baseline:
+            results["regressions"] = compare(
+                results, json.load(baseline), args.tolerance)
+        status = 1 if results["regressions"] else 0
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Seeds a database with generated trivia questions for benchmarking.
+
+    python -m benchmarks.seed --database sqlite:///bench.db --questions 100000
+"""
+import argparse
+import random
+import time
+
+from flask import Flask
+
+from models import (db, setup_db, question_fingerprint, Question, Category,
+                    QuestionCount)
+
+CATEGORIES = ["Science", "Art", "Geography", "History", "Entertainment",
+              "Sports"]
+
+VOLUMES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+
+
+"""
+seed(app, questions)
+    fills the database with the six trivia categories (when missing) and
+    `questions` generated questions spread across them
+"""
+
+
+def seed(app, questions, batch_size=5000):
+    rng = random.Random(0)
+    with app.app_context():
+        if Category.query.count() == 0:
+            db.session.execute(Category.__table__.insert(), [
+                {"id": i, "type": name} for i, name in enumerate(CATEGORIES, 1)])
+        batch = []
+        for number in range(questions):
+            question = "Benchmark question {} about {}?".format(
+                number, rng.choice(CATEGORIES).lower())
+            batch.append({
+                "question": question,
+                "fingerprint": question_fingerprint(question),
+                "answer": "Answer {}".format(number),
+                "category": rng.randint(1, len(CATEGORIES)),
+                "difficulty": rng.randint(1, 5),
+            })
+            if len(batch) == batch_size:
+                db.session.execute(Question.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(Question.__table__.insert(), batch)
+        db.session.commit()
+        QuestionCount.rebuild()
+
+
+def seed_database(database, questions):
+    app = Flask(__name__)
+    setup_db(app, database)
+    seed(app, questions)
+
+
+def parse_volume(value):
+    return VOLUMES.get(value.lower()) or int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--questions", type=parse_volume, default=1000,
+                        help="number of questions, or 1k/100k/1m")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed_database(args.database, args.questions)
+    print("seeded {} questions in {:.1f}s".format(
+        args.questions, time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Memory and latency of the in-memory question snapshot.
+
+    python -m benchmarks.snapshot --questions 100k --requests 500
+
+Seeds a SQLite file, then reports the snapshot's size (bytes and bytes
+per 100k questions) next to the Python heap taken by the same rows loaded
+as ORM objects, and the median latency of question listings (first and
+deep page, cursor, category) and single questions served from the
+database and from the snapshot. Prints JSON.
+"""
+import argparse
+import gc
+import json
+import os
+
+os.environ.setdefault("RESPONSE_CACHE_SIZE", "0")
+import tempfile
+import time
+import tracemalloc
+
+from models import Question
+from flaskr import create_app
+from flaskr.pagination import encode_cursor
+from .run import percentile
+from .seed import seed_database, parse_volume
+
+
+def orm_bytes(app):
+    with app.app_context():
+        gc.collect()
+        tracemalloc.start()
+        rows = Question.query.all()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del rows
+    return size
+
+
+def request_microseconds(client, path, requests):
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(path)
+        latencies.append(time.perf_counter() - started)
+    return percentile(latencies, 0.5) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--questions", type=parse_volume, default=100000,
+                        help="number of questions, or 1k/100k/1m")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database = "sqlite:///" + os.path.join(directory, "trivia.db")
+    seed_database(database, args.questions)
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database})
+    snapshot = app.extensions["question_snapshot"]
+    client = app.test_client()
+
+    with app.app_context():
+        started = time.perf_counter()
+        snapshot.load()
+        load_seconds = time.perf_counter() - started
+        statistics = snapshot.statistics()
+        middle = Question.query.order_by(Question.id).offset(
+            args.questions // 2).first().id
+
+    paths = {
+        "first_page": "/questions",
+        "deep_page": "/questions?page={}".format(args.questions // 20),
+        "cursor": "/questions?cursor=" + encode_cursor(middle),
+        "category": "/categories/3/questions?page=100",
+        "single": "/questions/{}".format(middle),
+    }
+    latencies = {}
+    for name, path in paths.items():
+        timings = {}
+        for enabled in (False, True):
+            app.config["QUESTION_SNAPSHOT"] = enabled
+            request_microseconds(client, path, 20)
+            timings["snapshot" if enabled else "database"] = \
+                request_microseconds(client, path, args.requests)
+        latencies[name] = timings
+
+    orm = orm_bytes(app)
+    print(json.dumps({
+        "questions": args.questions,
+        "snapshot_load_s": load_seconds,
+        "snapshot_bytes": statistics["bytes"],
+        "snapshot_bytes_per_100k": statistics["bytes_per_100k_questions"],
+        "orm_bytes": orm,
+        "orm_bytes_per_100k": orm * 100000 // args.questions,
+        "p50_us": latencies,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
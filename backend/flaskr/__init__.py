@@ -1,30 +1,171 @@
-from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
+import math
 import random
+import secrets
+from functools import partial
 
-from sqlalchemy import not_
-
-from models import setup_db, Question, Category
-
-QUESTIONS_PER_PAGE = 10
-
-
-def paginate_questions(request, selection):
-    page = request.args.get("page", 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
+import click
+from flask import Flask, Response, request, abort, stream_with_context
+from flask_cors import CORS
 
-    return current_questions
+from models import (db, setup_db, pool_statistics, backfill_fingerprints,
+                    DuplicateQuestion, Question, QuestionChange,
+                    QuestionCount)
+from .pagination import (QUESTION_COLUMNS, QUIZ_COLUMNS, paginate_questions,
+                         page_offset, page_size, question_columns, next_cursor)
+from .totals import QuestionTotals
+from .quiz import (QuestionSampler, INITIAL_RATING, MIN_DIFFICULTY,
+                   MAX_DIFFICULTY, target_difficulty, next_rating,
+                   split_previous_questions, ids_with_fingerprints,
+                   quiz_question_statement, next_permuted_id)
+from .sessions import create_session_store
+from .search import create_search
+from .categories import CategoryRegistry
+from .caching import ResponseCache
+from .bulk import read_rows, validate_row, import_questions, export_questions
+from .instrumentation import Instrumentation, internal
+from .serialization import init_json, jsonify
+from .routing import ReplicaRouting
+from .ratelimit import RateLimiter
+from .snapshot import QuestionSnapshot
+from .batch import BatchRunner
+from .dedupe import DEDUPE_ENDPOINT, DEDUPE_THRESHOLD, near_duplicates
+from .changes import ChangeFeed, CHANGES_RETRY_AFTER
+
+
+def previous_question_ids(previous_questions):
+    ids, fingerprints = split_previous_questions(previous_questions)
+    if fingerprints:
+        ids.update(db.session.execute(
+            ids_with_fingerprints(fingerprints)).scalars())
+    return ids
+
+
+def quiz_category_id(quiz_category):
+    # "All" is sent as the click event ({'type': 'click', 'id': 0});
+    # other ids are numbers or numeric strings.
+    quiz_category = quiz_category or {}
+    if not isinstance(quiz_category, dict):
+        abort(400)
+    category = quiz_category.get('id')
+    if quiz_category.get('type') == 'click' or not category:
+        return None
+    if isinstance(category, bool) or not isinstance(category, (int, str)):
+        abort(400)
+    try:
+        return int(category)
+    except ValueError:
+        abort(400)
+
+
+# Adaptive quizzes also tell the client how hard each question is.
+ADAPTIVE_QUIZ_COLUMNS = QUIZ_COLUMNS + (Question.difficulty,)
+
+
+def quiz_rating(body):
+    # An explicit difficulty wins over a rating; both are optional, and
+    # must lie on the difficulty scale ("nan" and "inf" don't).
+    try:
+        if body.get('difficulty') is not None:
+            rating = float(int(body['difficulty']))
+        elif body.get('rating') is not None:
+            rating = float(body['rating'])
+        else:
+            return None
+    except (TypeError, ValueError):
+        abort(400)
+    if not (math.isfinite(rating) and
+            MIN_DIFFICULTY <= rating <= MAX_DIFFICULTY):
+        abort(400)
+    return rating
+
+
+def quiz_question(question_id, columns=QUIZ_COLUMNS):
+    row = db.session.execute(
+        quiz_question_statement(question_id, columns)).first()
+    return row and row._asdict()
+
+
+def change_version(value):
+    # ?since= or Last-Event-ID: a version of the change log, if given.
+    if value is None:
+        return None
+    try:
+        version = int(value)
+    except ValueError:
+        abort(400)
+    if version < 0:
+        abort(400)
+    return version
+
+
+def write_response(**response):
+    # Writes only echo the current page when one is asked for explicitly.
+    response["success"] = True
+    if "page" in request.args:
+        response["questions"] = paginate_questions(
+            request, Question.query.order_by(Question.id))
+    return response
+
+
+def warm_caches(app):
+    # Loads the in-memory caches up front, e.g. in serve.py before
+    # forking workers that then share them copy-on-write.
+    with app.app_context():
+        for warm in app.extensions["warmers"]:
+            warm()
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    app.config.setdefault("DEDUPE_ENDPOINT", DEDUPE_ENDPOINT)
+    init_json(app)
+    instrumentation = Instrumentation(app)
+    rate_limiter = RateLimiter(app)
     setup_db(app)
+    totals = QuestionTotals(app)
+    categories = CategoryRegistry(app)
+    response_cache = ResponseCache(app)
+    sampler = QuestionSampler(app)
+    app.extensions["quiz_sessions"] = create_session_store()
+    search_engine = create_search(app)
+    routing = ReplicaRouting(app)
+    snapshot = QuestionSnapshot(app)
+    batch = BatchRunner(app)
+    change_feed = ChangeFeed(app)
+    app.extensions["question_snapshot"] = snapshot
+    # The change feed's version is read first, before the caches load.
+    app.extensions["warmers"] = [change_feed.warm, categories.load,
+                                 sampler.load, snapshot.warm]
+    if hasattr(search_engine, "load"):
+        app.extensions["warmers"].append(search_engine.load)
+
+    @app.cli.command("rebuild-counts")
+    def rebuild_counts():
+        """Recount question_counts after loading data outside the API."""
+        QuestionCount.rebuild()
+        totals.invalidate()
+
+    @app.cli.command("fingerprint-questions")
+    def fingerprint_questions():
+        """Fill in missing question fingerprints, e.g. after loading data."""
+        with db.engine.begin() as connection:
+            print("fingerprinted {} questions".format(
+                backfill_fingerprints(connection)))
+
+    @app.cli.command("prune-changes")
+    @click.option("--keep", default=100000, show_default=True,
+                  help="Number of the latest changes to keep.")
+    def prune_changes(keep):
+        """Delete old question changes; readers from before them reload."""
+        print("pruned {} changes".format(QuestionChange.prune(max(keep, 1))))
+
+    def question_row(question_id, columns=QUIZ_COLUMNS):
+        if snapshot.enabled:
+            return snapshot.get(question_id, columns)
+        return quiz_question(question_id, columns)
 
     @app.route('/')
     def index():
@@ -45,33 +186,26 @@ def create_app(test_config=None):
 
     # Endpoint to handle GET requests for all available categories.
     @app.route('/categories')
+    @routing.read_only
+    @response_cache.cached
     def retrieve_categories():
-        categories = Category.query.order_by(Category.id).all()
-        data = []
-        for category in categories:
-            data.append({
-                "id": category.id,
-                "type": category.type
-            })
         return jsonify({
             "success": True,
-            "categories": data,
-            "total_categories": len(Category.query.all()),
+            "categories": categories.formatted(),
+            "total_categories": len(categories),
         })
 
     # Endpoint to handle GET requests for questions, including pagination (every 10 questions).
     # This endpoint returns a list of questions,number of total questions, current category, categories.
     @app.route("/questions")
+    @routing.read_only
+    @response_cache.cached
     def retrieve_questions():
-        selection = Question.query.order_by(Question.id).all()
-        categories = Category.query.order_by(Category.id).all()
-        current_questions = paginate_questions(request, selection)
-        data = []
-        for category in categories:
-            data.append({
-                "id": category.id,
-                "type": category.type
-            })
+        if snapshot.enabled:
+            current_questions = snapshot.paginate(request)
+        else:
+            selection = Question.query.order_by(Question.id)
+            current_questions = paginate_questions(request, selection)
 
         if len(current_questions) == 0:
             abort(404)
@@ -79,27 +213,27 @@ def create_app(test_config=None):
         return jsonify({
             "success": True,
             "questions": current_questions,
-            "categories": data,
-            "total_questions": len(Question.query.all()),
+            "categories": categories.formatted(),
+            "total_questions": totals.questions(),
+            "next_cursor": next_cursor(current_questions, page_size(request)),
         })
 
     # GET questions with specific ID
     @app.route('/questions/<int:question_id>', methods=["GET"])
+    @routing.read_only
+    @response_cache.cached
     def retrieve_question_by_id(question_id):
-        question = Question.query.filter(
-            Question.id == question_id).one_or_none()
+        question = question_row(question_id, QUESTION_COLUMNS)
 
         if question is None:
             abort(404)
         else:
-            current_category = Category.query.filter(
-                Category.id == question.category).all()
             jsonStr = {
-                "id": question.id,
-                "answer": question.answer,
-                "difficulty": question.difficulty,
-                "question": question.question,
-                "category": current_category[0].type
+                "id": question["id"],
+                "answer": question["answer"],
+                "difficulty": question["difficulty"],
+                "question": question["question"],
+                "category": categories.type(question["category"])
 
             }
             return jsonify({
@@ -125,18 +259,39 @@ def create_app(test_config=None):
                 abort(404)
 
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
 
-            return jsonify({
-                "success": True,
-                "deleted": question_id,
-                "questions": current_questions,
-                "total_questions": len(Question.query.all()),
-            })
+            return jsonify(write_response(
+                deleted=question_id, total_questions=totals.questions()))
         except:
             abort(422)
 
+    # PATCH endpoint to edit a question in place.
+    @app.route("/questions/<int:question_id>", methods=["PATCH"])
+    def update_question(question_id):
+        question = Question.query.get(question_id)
+        if question is None:
+            abort(404)
+
+        body = request.get_json()
+        if not isinstance(body, dict):
+            abort(400)
+        fields = question.format()
+        fields.update({key: body[key] for key in fields if key in body})
+        try:
+            fields = validate_row(fields, categories)
+        except ValueError:
+            abort(422)
+
+        for key, value in fields.items():
+            setattr(question, key, value)
+        question.update()
+
+        return jsonify({
+            "success": True,
+            "updated": question_id,
+            "question": dict(fields, id=question_id)
+        })
+
     """
     TEST: When you click the trash icon next to a question, the question will be removed.
     This removal will persist in the database and when you refresh the page.
@@ -148,11 +303,11 @@ def create_app(test_config=None):
     @app.route("/questions", methods=["POST"])
     def post_question():
         body = request.get_json()
-        new_question = body.get("question", None)
-        answer = body.get("answer", None)
-        category = body.get("category", None)
-        difficulty = body.get("difficulty", None)
         search = body.get("searchTerm", None)
+        if search:
+            limited = rate_limiter.charge("search_questions")
+            if limited is not None:
+                return limited
 
         """
         TEST: Search by any phrase. The questions list will update to include
@@ -164,43 +319,87 @@ def create_app(test_config=None):
             # It should return any questions for whom the search term
             # is a substring of the question.
             if search:
-                selection = Question.query.order_by(Question.id).filter(
-                    Question.question.ilike("%{}%".format(search))
-                )
-                current_questions = paginate_questions(request, selection)
-                curr_cat_id = current_questions[0]['category']
-
-                current_category = Category.query.filter(
-                    Category.id == curr_cat_id).all()
-
-                return jsonify(
-                    {
-                        "success": True,
-                        "questions": current_questions,
-                        "total_questions": len(selection.all()),
-                        "current_category":  current_category[0].type
-                    }
-                )
+                return search_by_term(search, body)
 
             else:
-                if new_question or answer == '':
-                    abort(422)
-                question = Question(
-                    question=new_question, answer=answer, category=category, difficulty=difficulty)
-                question.insert()
-                selection = Question.query.order_by(Question.id).all()
-                current_questions = paginate_questions(request, selection)
-
-                return jsonify({
-                    "success": True,
-                    "created": question.id,
-                    "questions": current_questions,
-                    "total_questions": len(Question.query.all())
-                })
+                fields = validate_row(body, categories)
+                question = Question(**fields).insert()
+
+                return jsonify(write_response(
+                    created=question["id"], total_questions=totals.questions()))
 
+        except DuplicateQuestion:
+            raise
         except:
             abort(422)
 
+    # The search branch of POST /questions only reads, so it may use a
+    # replica like the GET endpoints.
+    @routing.read_only
+    def search_by_term(search, body):
+        current_questions, total = search_engine.search(
+            search, answers=bool(body.get("searchAnswers")),
+            offset=page_offset(request) or 0, limit=page_size(request),
+            columns=question_columns(request))
+        curr_cat_id = current_questions[0].get('category')
+
+        return jsonify(
+            {
+                "success": True,
+                "questions": current_questions,
+                "total_questions": total,
+                "current_category":  categories.type(curr_cat_id)
+            }
+        )
+
+    # GET endpoint for ranked full-text search over question text,
+    # and over answers too with ?answers=true.
+    @app.route("/questions/search")
+    @routing.read_only
+    def search_questions():
+        search = request.args.get("q", "")
+        answers = request.args.get("answers", "false").lower() in ("1", "true")
+        offset = page_offset(request)
+        if offset is None:
+            abort(404)
+
+        current_questions, total = search_engine.search(
+            search, answers=answers, offset=offset, limit=page_size(request),
+            columns=question_columns(request))
+
+        if len(current_questions) == 0:
+            abort(404)
+
+        return jsonify({
+            "success": True,
+            "questions": current_questions,
+            "total_questions": total,
+            "current_category": categories.type(current_questions[0].get('category'))
+        })
+
+    # Bulk import of questions streamed as NDJSON or CSV (text/csv).
+    @app.route("/questions/bulk", methods=["POST"])
+    def bulk_import_questions():
+        rows = read_rows(request.stream, request.mimetype)
+        inserted, errors = import_questions(rows, categories)
+
+        if inserted == 0 and errors:
+            abort(422)
+
+        return jsonify({
+            "success": True,
+            "inserted": inserted,
+            "errors": errors,
+            "total_questions": totals.questions()
+        })
+
+    # Streams every question as NDJSON.
+    @app.route("/questions/export")
+    @routing.read_only
+    def export_all_questions():
+        return Response(stream_with_context(export_questions()),
+                        mimetype="application/x-ndjson")
+
     """
     TEST: When you submit a question on the "Add" tab,
     the form will clear and the question will appear at the end of the last page
@@ -209,20 +408,26 @@ def create_app(test_config=None):
 
    # Create a GET endpoint to get questions based on category.
     @app.route("/categories/<int:category>/questions")
+    @routing.read_only
+    @response_cache.cached
     def retrieve_question(category):
-        selection = Question.query.filter(
-            Question.category == category).all()
-        current_questions = paginate_questions(request, selection)
-        current_category = Category.query.filter(Category.id == category).all()
+        if snapshot.enabled:
+            current_questions = snapshot.paginate(request, category)
+        else:
+            selection = Question.query.filter(
+                Question.category == category).order_by(Question.id)
+            current_questions = paginate_questions(request, selection)
+        current_category = categories.type(category)
 
-        if len(current_questions) == 0:
+        if len(current_questions) == 0 or current_category is None:
             abort(404)
 
         return jsonify({
             "success": True,
             "questions": current_questions,
-            "total_questions": len(Question.query.all()),
-            "current_category": current_category[0].type
+            "total_questions": totals.questions(category),
+            "current_category": current_category,
+            "next_cursor": next_cursor(current_questions, page_size(request))
         })
 
     """
@@ -237,51 +442,128 @@ def create_app(test_config=None):
     # if provided, and that is not one of the previous questions.
 
     @app.route('/quizzes', methods=['POST'])
+    @routing.read_only
     def get_quiz():
         body = request.get_json()
-        prevQuestions = body.get('previous_questions')
-        quizCategory = body.get('quiz_category')
-        question = []
-        currentQuest = {}
+        if not isinstance(body, dict):
+            abort(400)
+        prevQuestions = body.get('previous_questions') or []
+        category = quiz_category_id(body.get('quiz_category'))
+        rating = quiz_rating(body)
+        difficulty = None if rating is None else target_difficulty(rating)
+
+        exclude = previous_question_ids(prevQuestions)
+        currentQuest = None
+        while currentQuest is None:
+            question_id = sampler.sample(category, exclude, difficulty)
+            if question_id is None:
+                abort(404)
+            currentQuest = question_row(question_id)
+            if currentQuest is None:
+                # deleted by another worker since the ids were loaded
+                sampler.discard(question_id)
 
-        if quizCategory['type'] == 'click':
-            try:
-                n = random.randint(1, 6)
-                question = Question.query.filter(
-                    Question.category == n).filter(not_(Question.question.in_(prevQuestions))).all()
-                if question == []:
-                    n = random.randint(1, 6)
-                    newQuestion = Question.query.filter(Question.category == n).filter(
-                        not_(Question.question.in_(prevQuestions))).all()
-                    currentQuest = newQuestion
-                else:
-                    currentQuest = question
-                return jsonify({
-                    "success": True,
-                    "question": {'id': currentQuest[0].id, 'question': currentQuest[0].question, "answer": currentQuest[0].answer, }
-                })
-            except:
+        return jsonify({
+            "success": True,
+            "question": currentQuest
+        })
+
+    # Quiz sessions walk a shuffled order of the question ids, kept on
+    # the server as a seed and a position, so starting one is constant
+    # time and no round needs the client to send every previous question. Adaptive sessions ("adaptive",
+    # "rating" or "difficulty" in the body) instead keep a rating that
+    # follows the answers and pick each question near its difficulty.
+    @app.route('/quizzes/sessions', methods=['POST'])
+    @routing.read_only
+    def create_quiz_session():
+        body = request.get_json() or {}
+        category = quiz_category_id(body.get('quiz_category'))
+        rating = quiz_rating(body)
+        session_id = secrets.token_urlsafe(16)
+
+        if body.get('adaptive') or rating is not None:
+            total = sampler.count(category)
+            if not total:
                 abort(404)
-        else:
+            if rating is None:
+                rating = INITIAL_RATING
+            app.extensions["quiz_sessions"].create_adaptive(
+                session_id, category, rating)
+            return jsonify({
+                "success": True,
+                "session_id": session_id,
+                "total_questions": total,
+                "rating": rating
+            })
+
+        total = sampler.count(category)
+        if not total:
+            abort(404)
+
+        app.extensions["quiz_sessions"].create(
+            session_id, random.getrandbits(64), category,
+            sampler.max_id() + 1, total)
+
+        return jsonify({
+            "success": True,
+            "session_id": session_id,
+            "total_questions": total
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    @routing.read_only
+    def next_quiz_question(session_id):
+        store = app.extensions["quiz_sessions"]
+        try:
+            adaptive = store.adaptive(session_id)
+        except KeyError:
+            abort(404)
+        if adaptive is not None:
+            body = request.get_json(silent=True) or {}
+            return jsonify(next_adaptive_question(
+                store, session_id, *adaptive, correct=body.get('correct')))
+
+        currentQuest = None
+        while currentQuest is None:
             try:
-                if prevQuestions == []:
-                    question = Question.query.filter(
-                        Question.category == quizCategory['id']).all()
-                    n = random.randrange(0, len(question) - 1)
-                    currentQuest = question[n]
-
-                else:
-                    question = Question.query.filter(
-                        Question.category == quizCategory['id']).filter(not_(Question.question.in_(prevQuestions))).all()
-                    n = random.randrange(0, len(question))
-                    currentQuest = question[n]
-                return jsonify({
-                    "success": True,
-                    "question": {'id': currentQuest.id, 'question': currentQuest.question, "answer": currentQuest.answer, }
-                })
-
-            except:
+                question_id, remaining = store.advance(
+                    session_id, partial(next_permuted_id, sampler))
+            except KeyError:
                 abort(404)
+            if question_id is None:
+                break
+            currentQuest = question_row(question_id)
+
+        return jsonify({
+            "success": True,
+            "question": currentQuest,
+            "remaining": remaining
+        })
+
+    def next_adaptive_question(store, session_id, category, rating, seen,
+                               correct=None):
+        # `correct` grades the previous question of the session.
+        if correct is not None:
+            rating = next_rating(rating, bool(correct))
+        currentQuest = None
+        question_id = None
+        while currentQuest is None:
+            question_id = sampler.sample(
+                category, seen, target_difficulty(rating))
+            if question_id is None:
+                break
+            currentQuest = question_row(question_id, ADAPTIVE_QUIZ_COLUMNS)
+            if currentQuest is None:
+                sampler.discard(question_id)
+        store.record(session_id, question_id, rating)
+
+        asked = len(seen) + (currentQuest is not None)
+        return {
+            "success": True,
+            "question": currentQuest,
+            "remaining": max(0, sampler.count(category) - asked),
+            "rating": rating
+        }
 
     """
     TEST: In the "Play" tab, after a user selects "All" or a category,
@@ -289,6 +571,117 @@ def create_app(test_config=None):
     and shown whether they were correct or not.
     """
 
+    # Several GET requests to the read endpoints in one round trip, e.g.
+    # the first page of questions and the categories on startup.
+    @app.route('/batch', methods=['POST'])
+    @routing.read_only
+    def run_batch():
+        paths = batch.paths(request.get_json(silent=True))
+        return jsonify({
+            "success": True,
+            "responses": batch.run(paths)
+        })
+
+    # Changes to questions after ?since=<version>, oldest first, so
+    # clients apply them instead of refetching pages. Without ?since=,
+    # just the current version to start from. A "reset" change means
+    # reload everything.
+    @app.route('/changes')
+    @routing.read_only
+    def retrieve_changes():
+        since = change_version(request.args.get("since"))
+        if since is None:
+            return jsonify({
+                "success": True,
+                "changes": [],
+                "version": QuestionChange.latest(),
+                "more": False
+            })
+        changes = change_feed.since(since)
+        return jsonify({
+            "success": True,
+            "changes": changes,
+            "version": changes[-1]["version"] if changes else since,
+            "more": len(changes) == app.config["CHANGES_PAGE_SIZE"]
+        })
+
+    # The same changes as Server-Sent Events, from ?since= or the
+    # Last-Event-ID of a reconnecting EventSource, else from now on.
+    # Workers with CHANGES_MAX_STREAMS open streams answer a real 503,
+    # and clients poll GET /changes meanwhile.
+    @app.route('/changes/stream')
+    @routing.read_only
+    def stream_changes():
+        since = change_version(request.headers.get(
+            "Last-Event-ID", request.args.get("since")))
+        if since is None:
+            since = QuestionChange.latest()
+        if not change_feed.open_stream():
+            response = jsonify({
+                "success": False,
+                "error": 503,
+                "message": "too many streams"
+            })
+            response.status_code = 503
+            response.headers["Retry-After"] = str(CHANGES_RETRY_AFTER)
+            return response
+        response = Response(stream_with_context(change_feed.stream(since)),
+                            mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache",
+                                     "X-Accel-Buffering": "no"})
+        response.call_on_close(change_feed.close_stream)
+        return response
+
+    # Connection pool statistics, for sizing DB_POOL_SIZE/DB_MAX_OVERFLOW.
+    @app.route('/internal/pool')
+    @internal
+    def retrieve_pool_statistics():
+        return jsonify({
+            "success": True,
+            "pool": pool_statistics()
+        })
+
+    # Size of the in-memory question snapshot, including per 100k questions.
+    @app.route('/internal/snapshot')
+    @internal
+    def retrieve_snapshot_statistics():
+        if not snapshot.enabled:
+            abort(404)
+        return jsonify({
+            "success": True,
+            "snapshot": snapshot.statistics()
+        })
+
+    # Pairs of questions with near-identical text (MinHash/LSH over the
+    # whole bank, or one ?category=), for review: ?threshold= is the
+    # minimum trigram Jaccard similarity. Off unless DEDUPE_ENDPOINT.
+    @app.route('/internal/duplicates')
+    def retrieve_near_duplicates():
+        if not app.config["DEDUPE_ENDPOINT"]:
+            abort(404)
+        try:
+            threshold = float(request.args.get("threshold", DEDUPE_THRESHOLD))
+            category = request.args.get("category", None)
+            if category is not None:
+                category = int(category)
+        except ValueError:
+            abort(400)
+        if not 0 < threshold <= 1:
+            abort(400)
+        pairs = near_duplicates(threshold, category)
+        return jsonify({
+            "success": True,
+            "pairs": pairs,
+            "total_pairs": len(pairs)
+        })
+
+    # Per-endpoint query counts and timings in Prometheus text format.
+    @app.route('/metrics')
+    @internal
+    def retrieve_metrics():
+        return Response(instrumentation.prometheus(),
+                        mimetype="text/plain; version=0.0.4")
+
     # Create error handlers for all expected errors
     # including 404 and 422.
 
@@ -308,6 +701,15 @@ def create_app(test_config=None):
             })
         )
 
+    @app.errorhandler(DuplicateQuestion)
+    def duplicate_question(error):
+        return (
+            jsonify({
+                "success": False, "error": 409, "message": "duplicate question",
+                "duplicate_of": error.question_id
+            })
+        )
+
     @app.errorhandler(400)
     def bad_request(error):
         return (
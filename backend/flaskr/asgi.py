@@ -0,0 +1,290 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from urllib.parse import parse_qs
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.exceptions import HTTPException, abort
+
+from models import (database_path, Question, Category, QuestionCount,
+                    ALL_QUESTIONS)
+from .pagination import (QUESTION_COLUMNS, next_cursor, page_size, page_window,
+                         paged, question_columns)
+from .quiz import (QuestionIndex, target_difficulty, split_previous_questions,
+                   ids_with_fingerprints, quiz_question_statement)
+from .serialization import create_provider
+from . import quiz_category_id, quiz_rating
+
+# Seconds between reloads of the async app's quiz id buckets, since
+# writes go through the sync app in other processes.
+QUIZ_IDS_TTL = int(os.getenv('QUIZ_IDS_TTL', 60))
+
+logger = logging.getLogger("trivia.asgi")
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+ERROR_MESSAGES = {
+    400: "bad request",
+    404: "resource not found",
+    422: "unprocessable",
+    500: "internal server error",
+}
+
+
+def async_database_url(database):
+    url = make_url(database)
+    return url.set(drivername=ASYNC_DRIVERS.get(
+        url.get_backend_name(), url.drivername))
+
+
+class Request:
+
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = {
+            key: values[-1] for key, values in
+            parse_qs(scope.get("query_string", b"").decode()).items()
+        }
+        self.body = body
+
+    def get_json(self):
+        try:
+            return json.loads(self.body or b"null")
+        except ValueError:
+            abort(400)
+
+
+"""
+AsyncTriviaApp
+    ASGI application serving the read and quiz routes of create_app
+    (/categories, /questions, /categories/<id>/questions, /quizzes) with
+    async views on SQLAlchemy's asyncio engine (asyncpg for PostgreSQL,
+    aiosqlite for SQLite). It shares the Question/Category models, the
+    pagination and quiz helpers, and answers with the same JSON bodies,
+    so clients can't tell them apart. Quiz ids are loaded at startup and
+    reloaded every QUIZ_IDS_TTL seconds by a background task.
+"""
+
+
+class AsyncTriviaApp:
+
+    def __init__(self, database=database_path, **engine_options):
+        self.engine = create_async_engine(
+            async_database_url(database), **engine_options)
+        self.sessions = sessionmaker(
+            self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.json = create_provider()
+        self.categories = None
+        self.quiz_ids = None
+        self._refresher = None
+        self.routes = [
+            ("GET", re.compile(r"^/categories$"), self.retrieve_categories),
+            ("GET", re.compile(r"^/questions$"), self.retrieve_questions),
+            ("GET", re.compile(r"^/categories/(\d+)/questions$"),
+             self.retrieve_question),
+            ("POST", re.compile(r"^/quizzes$"), self.get_quiz),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        status, payload = await self.dispatch(Request(scope, body))
+        content = self.json.dumps(payload)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(content)).encode()),
+                (b"access-control-allow-origin", b"*"),
+                (b"access-control-allow", b"*"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.load_categories()
+                await self.load_quiz_ids()
+                self._refresher = asyncio.create_task(self.refresh_quiz_ids())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._refresher is not None:
+                    self._refresher.cancel()
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def dispatch(self, request):
+        for method, pattern, view in self.routes:
+            match = pattern.match(request.path)
+            if match and method == request.method:
+                break
+        else:
+            return self.error(404)
+
+        try:
+            async with self.sessions() as session:
+                return 200, await view(session, request, *match.groups())
+        except HTTPException as error:
+            return self.error(error.code)
+        except Exception:
+            return self.error(500)
+
+    def error(self, code):
+        # Mirrors the Flask error handlers, which answer with a 200.
+        return 200, {
+            "success": False, "error": code, "message": ERROR_MESSAGES[code]
+        }
+
+    async def load_categories(self, session=None):
+        if session is None:
+            async with self.sessions() as session:
+                return await self.load_categories(session)
+        rows = await session.execute(select(Category).order_by(Category.id))
+        self.categories = [category.format() for category in rows.scalars()]
+
+    async def category_types(self, session):
+        if self.categories is None:
+            await self.load_categories(session)
+        return {category["id"]: category["type"] for category in self.categories}
+
+    async def total_questions(self, session, category=None):
+        key = ALL_QUESTIONS if category is None else category
+        counter = await session.get(QuestionCount, key)
+        if counter is not None:
+            return counter.total
+        statement = select(func.count(Question.id))
+        if category is not None:
+            statement = statement.where(Question.category == category)
+        return (await session.execute(statement)).scalar()
+
+    async def paginate_questions(self, session, request, statement):
+        window = page_window(request)
+        if window is None:
+            return []
+        rows = await session.execute(paged(
+            statement.with_only_columns(*question_columns(request)), window))
+        return [row._asdict() for row in rows]
+
+    async def retrieve_categories(self, session, request):
+        if self.categories is None:
+            await self.load_categories(session)
+        return {
+            "success": True,
+            "categories": self.categories,
+            "total_categories": len(self.categories),
+        }
+
+    async def retrieve_questions(self, session, request):
+        current_questions = await self.paginate_questions(
+            session, request, select(*QUESTION_COLUMNS).order_by(Question.id))
+
+        if len(current_questions) == 0:
+            abort(404)
+
+        if self.categories is None:
+            await self.load_categories(session)
+        return {
+            "success": True,
+            "questions": current_questions,
+            "categories": self.categories,
+            "total_questions": await self.total_questions(session),
+            "next_cursor": next_cursor(current_questions, page_size(request)),
+        }
+
+    async def retrieve_question(self, session, request, category):
+        category = int(category)
+        current_questions = await self.paginate_questions(
+            session, request, select(*QUESTION_COLUMNS).where(
+                Question.category == category).order_by(Question.id))
+        current_category = (await self.category_types(session)).get(category)
+
+        if len(current_questions) == 0 or current_category is None:
+            abort(404)
+
+        return {
+            "success": True,
+            "questions": current_questions,
+            "total_questions": await self.total_questions(session, category),
+            "current_category": current_category,
+            "next_cursor": next_cursor(current_questions, page_size(request)),
+        }
+
+    async def load_quiz_ids(self, session=None):
+        if session is None:
+            async with self.sessions() as session:
+                return await self.load_quiz_ids(session)
+        rows = (await session.execute(QuestionIndex.statement())).all()
+        # Building the buckets is CPU work; keep it off the event loop.
+        self.quiz_ids = await asyncio.get_running_loop().run_in_executor(
+            None, QuestionIndex.from_rows, rows)
+
+    async def refresh_quiz_ids(self):
+        while True:
+            await asyncio.sleep(QUIZ_IDS_TTL)
+            try:
+                await self.load_quiz_ids()
+            except Exception:
+                logger.exception("reloading quiz ids failed")
+
+    async def previous_question_ids(self, session, previous_questions):
+        ids, fingerprints = split_previous_questions(previous_questions)
+        if fingerprints:
+            rows = await session.execute(ids_with_fingerprints(fingerprints))
+            ids.update(rows.scalars())
+        return ids
+
+    async def get_quiz(self, session, request):
+        body = request.get_json()
+        if not isinstance(body, dict):
+            abort(400)
+        category = quiz_category_id(body.get('quiz_category'))
+        rating = quiz_rating(body)
+        difficulty = None if rating is None else target_difficulty(rating)
+        exclude = await self.previous_question_ids(
+            session, body.get('previous_questions') or [])
+
+        if self.quiz_ids is None:
+            # Served without the lifespan protocol: load on first use.
+            await self.load_quiz_ids(session)
+
+        currentQuest = None
+        while currentQuest is None:
+            question_id = self.quiz_ids.sample(category, exclude, difficulty)
+            if question_id is None:
+                abort(404)
+            row = (await session.execute(
+                quiz_question_statement(question_id))).first()
+            currentQuest = row and row._asdict()
+            if currentQuest is None:
+                self.quiz_ids.discard(question_id)
+
+        return {
+            "success": True,
+            "question": currentQuest
+        }
+
+
+def create_async_app(database=database_path, **engine_options):
+    return AsyncTriviaApp(database, **engine_options)
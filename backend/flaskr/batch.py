@@ -0,0 +1,89 @@
+import json
+import os
+
+from flask import abort, current_app, make_response, request
+from werkzeug.exceptions import HTTPException
+
+from .routing import PRIMARY_HEADER
+
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 10))
+
+# Read endpoints that may be called from a batch.
+BATCH_ENDPOINTS = (
+    "retrieve_categories",
+    "retrieve_questions",
+    "retrieve_question_by_id",
+    "retrieve_question",
+)
+
+# Passed on to every sub-request, so reads still see the client's writes.
+FORWARDED_HEADERS = ("Cookie", PRIMARY_HEADER)
+
+
+"""
+BatchRunner
+    runs several GET requests to the read endpoints in BATCH_ENDPOINTS
+    within the app context, database session and in-memory caches of one
+    POST /batch request, and returns each one's path, status and JSON
+    body. Errors of a sub-request (unknown path, endpoint not allowed,
+    404 from the view) are reported in its own status, not the batch's.
+    At most BATCH_MAX_REQUESTS sub-requests per batch.
+"""
+
+
+class BatchRunner:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("BATCH_MAX_REQUESTS", BATCH_MAX_REQUESTS)
+        app.config.setdefault("BATCH_ENDPOINTS", BATCH_ENDPOINTS)
+
+    def paths(self, body):
+        # [{"path": "/questions?page=1"}, {"method": "GET", "path": ...}]
+        if not isinstance(body, dict):
+            abort(400)
+        items = body.get("requests")
+        if not isinstance(items, list) or not items or \
+                len(items) > current_app.config["BATCH_MAX_REQUESTS"]:
+            abort(400)
+        paths = []
+        for item in items:
+            if not isinstance(item, dict) or \
+                    not isinstance(item.get("path"), str) or \
+                    not item["path"].startswith("/") or \
+                    str(item.get("method", "GET")).upper() != "GET":
+                abort(400)
+            paths.append(item["path"])
+        return paths
+
+    def run(self, paths):
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS
+                   if name in request.headers}
+        return [self._run_one(path, headers) for path in paths]
+
+    def _run_one(self, path, headers):
+        with current_app.test_request_context(
+                path, method="GET", headers=headers):
+            status, response = self._dispatch()
+            return {
+                "path": path,
+                "status": status,
+                "body": json.loads(response.get_data()),
+            }
+
+    def _dispatch(self):
+        try:
+            if request.routing_exception is not None:
+                abort(404)
+            endpoint = request.url_rule.endpoint
+            if endpoint not in current_app.config["BATCH_ENDPOINTS"]:
+                abort(400)
+            view = current_app.view_functions[endpoint]
+            response = make_response(view(**request.view_args))
+            return response.status_code, response
+        except HTTPException as error:
+            return error.code, make_response(
+                current_app.handle_user_exception(error))
@@ -0,0 +1,183 @@
+import csv
+import json
+import os
+
+from models import (db, notify_question_change, question_fingerprint,
+                    Question, QuestionChange)
+from .pagination import QUESTION_COLUMNS
+from .serialization import dumps
+
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 1000))
+BULK_TRANSACTION_SIZE = int(os.getenv('BULK_TRANSACTION_SIZE', 10000))
+BULK_MAX_ERRORS = 100
+
+EXPORT_COLUMNS = QUESTION_COLUMNS
+
+
+# Stands in for a row with bytes that aren't UTF-8.
+NOT_UTF8 = object()
+
+
+"""
+read_rows(stream, mimetype)
+    yields (line_number, row) pairs from an NDJSON or CSV request body
+    without reading it into memory. CSV needs a header row naming the
+    question, answer, category and difficulty columns. Lines are decoded
+    one by one, so bad bytes only spoil their own row (NOT_UTF8).
+"""
+
+
+def _decoded_lines(stream, undecodable):
+    # Newline bytes never occur inside a UTF-8 sequence, so splitting
+    # before decoding is safe; adds the numbers of bad lines to
+    # `undecodable`.
+    for line_number, line in enumerate(stream, 1):
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError:
+            undecodable.add(line_number)
+            yield line.decode("utf-8", "replace")
+
+
+def read_rows(stream, mimetype):
+    undecodable = set()
+    lines = _decoded_lines(stream, undecodable)
+    if mimetype == "text/csv":
+        reader = csv.DictReader(lines)
+        last_line = 1
+        for row in reader:
+            # A quoted field may span several lines.
+            if undecodable.intersection(range(last_line + 1,
+                                              reader.line_num + 1)):
+                row = NOT_UTF8
+            last_line = reader.line_num
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if line_number in undecodable:
+            yield line_number, NOT_UTF8
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def validate_row(row, categories):
+    if row is NOT_UTF8:
+        raise ValueError("not valid UTF-8")
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+    question = row.get("question") or ""
+    answer = row.get("answer") or ""
+    if not isinstance(question, str) or not isinstance(answer, str):
+        raise ValueError("question and answer must be text")
+    question, answer = question.strip(), answer.strip()
+    if not question or not answer:
+        raise ValueError("question and answer are required")
+    try:
+        category = int(row.get("category"))
+        difficulty = int(row.get("difficulty"))
+    except (TypeError, ValueError):
+        raise ValueError("category and difficulty must be integers")
+    if category not in categories:
+        raise ValueError("unknown category {}".format(category))
+    if not 1 <= difficulty <= 5:
+        raise ValueError("difficulty must be between 1 and 5")
+    return {
+        "question": question,
+        "answer": answer,
+        "category": category,
+        "difficulty": difficulty,
+    }
+
+
+"""
+import_questions(rows, categories)
+    validates and inserts (line_number, row) pairs in executemany batches
+    of BULK_BATCH_SIZE, committing every BULK_TRANSACTION_SIZE rows with
+    a "reset" in the change log.
+    Invalid rows and duplicates (of a question in the table or earlier
+    in the import, by fingerprint, looked up once per batch) are skipped
+    and reported; returns (inserted, errors).
+"""
+
+
+def import_questions(rows, categories, batch_size=BULK_BATCH_SIZE,
+                     transaction_size=BULK_TRANSACTION_SIZE):
+    inserted = 0
+    uncommitted = 0
+    errors = []
+    batch = {}
+
+    def report(line_number, message):
+        if len(errors) < BULK_MAX_ERRORS:
+            errors.append({"line": line_number, "message": message})
+
+    def flush():
+        nonlocal uncommitted
+        # Earlier batches are flushed already, so this finds them too.
+        existing = Question.existing_fingerprints(list(batch))
+        questions = []
+        for fingerprint, (line_number, question) in batch.items():
+            if fingerprint in existing:
+                report(line_number, "duplicate question")
+            else:
+                questions.append(question)
+        if questions:
+            Question.insert_many(questions)
+        uncommitted += len(questions)
+        batch.clear()
+
+    try:
+        for line_number, row in rows:
+            try:
+                question = validate_row(row, categories)
+            except ValueError as error:
+                report(line_number, str(error))
+                continue
+            question["fingerprint"] = question_fingerprint(question["question"])
+            if question["fingerprint"] in batch:
+                report(line_number, "duplicate question")
+                continue
+            batch[question["fingerprint"]] = (line_number, question)
+
+            if len(batch) >= batch_size:
+                flush()
+            if uncommitted >= transaction_size:
+                QuestionChange.record("reset")
+                db.session.commit()
+                inserted += uncommitted
+                uncommitted = 0
+
+        if batch:
+            flush()
+        if uncommitted:
+            QuestionChange.record("reset")
+        db.session.commit()
+        inserted += uncommitted
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if inserted:
+            notify_question_change("reset", None)
+
+    return inserted, errors
+
+
+"""
+export_questions()
+    yields every question as an NDJSON line, streaming rows from a
+    server-side cursor so memory stays flat regardless of table size
+"""
+
+
+def export_questions(batch_size=BULK_BATCH_SIZE):
+    rows = Question.query.with_entities(*EXPORT_COLUMNS).order_by(
+        Question.id).yield_per(batch_size)
+    for row in rows:
+        yield dumps(row._asdict()) + b"\n"
@@ -0,0 +1,115 @@
+import os
+import secrets
+import threading
+import zlib
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, request
+
+from models import on_question_change, on_category_change
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+RESPONSE_CACHE_MAX_AGE = int(os.getenv('RESPONSE_CACHE_MAX_AGE', 0))
+
+
+"""
+ResponseCache
+    conditional GET and body caching for read endpoints. ETags are built
+    from a data version that every Question/Category write bumps, so an
+    If-None-Match hit is answered with 304 before the view (and the
+    database) is touched. Rendered bodies of the last RESPONSE_CACHE_SIZE
+    path+query keys are kept in an LRU and replayed while the data
+    version is unchanged, except to clients inside their read-your-writes
+    window, whose reads go to the primary.
+
+    The version is per process, and so is the random epoch in every
+    ETag: it is drawn again in a process forked from the one that drew
+    it (serve.py forks its workers from a loaded app), so workers whose
+    versions drift apart never share an ETag for different bodies.
+"""
+
+
+class ResponseCache:
+
+    def __init__(self, app=None, max_entries=RESPONSE_CACHE_SIZE,
+                 max_age=RESPONSE_CACHE_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._epoch = None
+        self._pid = None
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        on_question_change(app, self.bump)
+        on_category_change(app, self.bump)
+
+    @property
+    def epoch(self):
+        if self._pid != os.getpid():
+            self._epoch = secrets.token_hex(4)
+            self._pid = os.getpid()
+        return self._epoch
+
+    def bump(self, event=None, record=None):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def etag(self, key, version):
+        return "{}-{}-{:08x}".format(
+            self.epoch, version, zlib.crc32(key.encode()))
+
+    def _get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _put(self, key, version, body):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.full_path
+            version = self.version
+            etag = self.etag(key, version)
+
+            # A client reading its own writes from the primary (see
+            # flaskr.routing) gets neither a 304 nor a body that may have
+            # come from a lagging replica.
+            primary = g.get("db_read_only") is False
+            if not primary and request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                body = None if primary else self._get(key, version)
+                if body is not None:
+                    response = current_app.response_class(
+                        body, mimetype="application/json")
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    self._put(key, version, response.get_data())
+
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            response.cache_control.must_revalidate = True
+            return response
+        return wrapper
@@ -0,0 +1,64 @@
+import threading
+
+from models import on_category_change, Category
+
+
+"""
+CategoryRegistry
+    the categories table held in memory. It is loaded once by create_app
+    and reloaded on the next lookup after Category.insert/update/delete
+    bumps the version stamp.
+"""
+
+
+class CategoryRegistry:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._loaded_version = None
+        self._types = {}
+        self._formatted = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        on_category_change(app, self.invalidate)
+        with app.app_context():
+            self.load()
+
+    def load(self):
+        with self._lock:
+            version = self.version
+            categories = Category.query.order_by(Category.id).all()
+            self._formatted = [category.format() for category in categories]
+            self._types = {
+                category["id"]: category["type"] for category in self._formatted
+            }
+            self._loaded_version = version
+
+    def invalidate(self, event=None, category=None):
+        with self._lock:
+            self.version += 1
+
+    def _current(self):
+        if self._loaded_version != self.version:
+            self.load()
+
+    def __len__(self):
+        self._current()
+        return len(self._formatted)
+
+    def __contains__(self, category_id):
+        self._current()
+        return category_id in self._types
+
+    def formatted(self):
+        self._current()
+        return self._formatted
+
+    def type(self, category_id):
+        self._current()
+        if category_id is None:
+            return None
+        return self._types.get(int(category_id))
@@ -0,0 +1,230 @@
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from models import (db, change_origin, notify_question_change,
+                    CHANGES_CHANNEL, QuestionChange)
+from .serialization import dumps
+
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', 100))
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', 1))
+CHANGES_STREAM_SECONDS = float(os.getenv('CHANGES_STREAM_SECONDS', 300))
+# Open streams per worker; each holds a request thread, so more are
+# turned away (503) rather than starving the other requests.
+CHANGES_MAX_STREAMS = int(os.getenv('CHANGES_MAX_STREAMS', 8))
+# Seconds a client turned away waits before trying a stream again.
+CHANGES_RETRY_AFTER = 30
+# Seconds without a change before a stream sends a comment line, so
+# proxies don't close it as idle.
+CHANGES_KEEPALIVE = 15
+# Recent changes the follower keeps for the streams of its process.
+CHANGES_BUFFER_SIZE = 1000
+
+
+def coalesce(changes):
+    # (event, question) to apply for formatted changes in version order;
+    # a "reset" reloads everything, so what came before it is moot.
+    start = 0
+    for index, change in enumerate(changes):
+        if change["event"] == "reset":
+            start = index
+    return [(change["event"], change["question"])
+            for change in changes[start:]]
+
+
+"""
+ChangeFeed
+    reads the question change log (models.QuestionChange) for clients,
+    as pages of changes after a version (GET /changes) or as a stream of
+    Server-Sent Events (GET /changes/stream), and keeps the caches of
+    this process current with the writes of other processes: catch_up()
+    sends their changes to the question listeners, from a follower
+    thread started by follow() (serve.py starts one per worker).
+
+    The follower LISTENs on CHANGES_CHANNEL on PostgreSQL and polls the
+    log every CHANGES_POLL_INTERVAL seconds elsewhere (SQLite). The
+    changes it reads (of every process) are kept, up to
+    CHANGES_BUFFER_SIZE, and handed to the streams of this process, so
+    while it runs an open stream only reads the log to catch up from an
+    older version. At most CHANGES_MAX_STREAMS streams are open at once
+    (open_stream/close_stream).
+"""
+
+
+class ChangeFeed:
+
+    def __init__(self, app=None):
+        self.app = None
+        self.version = None
+        self._thread = None
+        self._changed = threading.Condition()
+        # Changes after version self._floor, in version order.
+        self._recent = deque()
+        self._floor = None
+        self._streams = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CHANGES_PAGE_SIZE", CHANGES_PAGE_SIZE)
+        app.config.setdefault("CHANGES_POLL_INTERVAL", CHANGES_POLL_INTERVAL)
+        app.config.setdefault("CHANGES_STREAM_SECONDS", CHANGES_STREAM_SECONDS)
+        app.config.setdefault("CHANGES_MAX_STREAMS", CHANGES_MAX_STREAMS)
+        app.extensions["change_feed"] = self
+        self.app = app
+
+    def warm(self):
+        # Runs before the caches load: a change committed in between is
+        # applied to them twice, which the question listeners allow.
+        self.version = QuestionChange.latest()
+        with self._changed:
+            self._recent.clear()
+            self._floor = self.version
+
+    def since(self, version, limit=None):
+        limit = limit or current_app.config["CHANGES_PAGE_SIZE"]
+        return [change.format()
+                for change in QuestionChange.since(version, limit)]
+
+    def catch_up(self):
+        # Applies the changes of other processes after self.version to
+        # this process's caches; returns how many were applied.
+        if self.version is None:
+            self.warm()
+            return 0
+        origin = change_origin()
+        limit = current_app.config["CHANGES_PAGE_SIZE"]
+        applied = 0
+        while True:
+            changes = QuestionChange.since(self.version, limit)
+            if not changes:
+                break
+            formatted = [change.format() for change in changes]
+            remote = [change for change, row in zip(formatted, changes)
+                      if row.origin != origin]
+            for event, question in coalesce(remote):
+                notify_question_change(event, question)
+                applied += 1
+            self.version = changes[-1].version
+            self._publish(formatted)
+            if len(changes) < limit:
+                break
+        return applied
+
+    def _publish(self, changes):
+        # Wakes the streams, only when there is something new for them.
+        with self._changed:
+            self._recent.extend(changes)
+            while len(self._recent) > CHANGES_BUFFER_SIZE:
+                self._floor = self._recent.popleft()["version"]
+            self._changed.notify_all()
+
+    def _following(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def follow(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._follow, name="change-follower", daemon=True)
+            self._thread.start()
+
+    def _follow(self):
+        interval = self.app.config["CHANGES_POLL_INTERVAL"]
+        listener = None
+        while True:
+            try:
+                with self.app.app_context():
+                    try:
+                        self.catch_up()
+                        if listener is None:
+                            listener = self._listen()
+                    finally:
+                        db.session.remove()
+                self._wait(listener, interval)
+            except Exception:
+                self.app.logger.exception("change feed follower failed")
+                listener = None
+                time.sleep(interval)
+
+    def _listen(self):
+        # PostgreSQL: a connection of its own, out of the pool, that
+        # LISTENs for the NOTIFY of every change. None elsewhere.
+        if db.engine.dialect.name != "postgresql":
+            return None
+        connection = db.engine.raw_connection()
+        connection.detach()
+        listener = connection.connection
+        listener.rollback()
+        listener.autocommit = True
+        listener.cursor().execute("LISTEN " + CHANGES_CHANNEL)
+        return listener
+
+    def _wait(self, listener, timeout):
+        # Until a notification arrives, or `timeout` seconds pass (which
+        # also picks up anything missed while reconnecting).
+        if listener is None:
+            time.sleep(timeout)
+        elif select.select([listener], [], [], timeout)[0]:
+            listener.poll()
+            listener.notifies.clear()
+
+    def _changes_after(self, version):
+        # From the follower's recent changes when they go back that far,
+        # else from the log.
+        limit = current_app.config["CHANGES_PAGE_SIZE"]
+        if self._following():
+            with self._changed:
+                if self._floor is not None and version >= self._floor:
+                    return [change for change in self._recent
+                            if change["version"] > version][:limit]
+        changes = self.since(version)
+        # Ends the read transaction, so the connection goes back to the
+        # pool while the stream waits, and the next poll sees changes
+        # committed meanwhile.
+        db.session.commit()
+        return changes
+
+    def open_stream(self):
+        # Takes one of CHANGES_MAX_STREAMS; False when all are taken.
+        with self._changed:
+            if self._streams >= current_app.config["CHANGES_MAX_STREAMS"]:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._changed:
+            self._streams -= 1
+
+    def stream(self, version):
+        # Server-Sent Events, one per change, with the version as the
+        # event id: EventSource sends it back as Last-Event-ID when it
+        # reconnects, e.g. after CHANGES_STREAM_SECONDS end the stream.
+        config = current_app.config
+        interval = config["CHANGES_POLL_INTERVAL"]
+        deadline = time.monotonic() + config["CHANGES_STREAM_SECONDS"]
+        quiet_since = time.monotonic()
+        yield "retry: {}\n\n".format(int(interval * 1000)).encode()
+        while True:
+            changes = self._changes_after(version)
+            for change in changes:
+                yield "id: {}\nevent: {}\ndata: ".format(
+                    change["version"], change["event"]).encode() + \
+                    dumps(change) + b"\n\n"
+            if changes:
+                version = changes[-1]["version"]
+                quiet_since = time.monotonic()
+                if len(changes) == config["CHANGES_PAGE_SIZE"]:
+                    continue
+            if time.monotonic() >= deadline:
+                return
+            if time.monotonic() - quiet_since >= CHANGES_KEEPALIVE:
+                yield b":\n\n"
+                quiet_since = time.monotonic()
+            # Woken by the follower when it has changes, else polls.
+            with self._changed:
+                self._changed.wait(interval)
@@ -0,0 +1,127 @@
+import os
+import random
+import zlib
+from collections import defaultdict
+
+from models import normalize_question, Question
+
+DEDUPE_THRESHOLD = float(os.getenv('DEDUPE_THRESHOLD', 0.7))
+# GET /internal/duplicates rebuilds the index on each call, so it is
+# off unless enabled.
+DEDUPE_ENDPOINT = os.getenv('DEDUPE_ENDPOINT', 'false').lower() == 'true'
+# 32 MinHash values in 8 bands of 4: pairs with Jaccard similarity 0.5
+# share a band about 40% of the time, at 0.7 about 89%, at 0.8 99%.
+DEDUPE_BINS = 32
+DEDUPE_BANDS = 8
+SHINGLE_SIZE = 3
+
+
+def shingles(question):
+    # Character trigrams of the normalized text, the text itself if shorter.
+    text = normalize_question(question)
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE]
+            for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+"""
+NearDuplicateIndex
+    MinHash signatures of question text with locality-sensitive hashing:
+    each signature is cut into bands, and questions sharing any band's
+    values land in the same bucket. Only questions sharing a bucket are
+    compared, so pairs() does work in proportion to the candidates found
+    rather than to every pair of questions.
+
+    Signatures use one permutation hashing: each shingle is hashed once,
+    its hash picks one of `bins` bins, and each bin keeps its smallest
+    value. An empty bin copies the first filled bin in a random order
+    fixed per bin, the same for every question (densification).
+"""
+
+
+class NearDuplicateIndex:
+
+    def __init__(self, bins=DEDUPE_BINS, bands=DEDUPE_BANDS, seed=0):
+        rng = random.Random(seed)
+        self.bins = bins
+        self.rows = bins // bands
+        self.bands = bands
+        self._probes = []
+        for _ in range(bins):
+            order = list(range(bins))
+            rng.shuffle(order)
+            self._probes.append(order)
+        self._buckets = defaultdict(list)
+        self._texts = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def signature(self, shingle_set):
+        bins = self.bins
+        filled = [None] * bins
+        for shingle in shingle_set:
+            value, position = divmod(zlib.crc32(shingle.encode()), bins)
+            current = filled[position]
+            if current is None or value < current:
+                filled[position] = value
+        signature = list(filled)
+        for position, value in enumerate(filled):
+            if value is None:
+                for probe in self._probes[position]:
+                    if filled[probe] is not None:
+                        signature[position] = filled[probe]
+                        break
+        return signature
+
+    def add(self, question_id, question):
+        self._texts[question_id] = question
+        signature = self.signature(shingles(question))
+        for band in range(self.bands):
+            values = tuple(signature[band * self.rows:(band + 1) * self.rows])
+            self._buckets[band, values].append(question_id)
+
+    def candidates(self):
+        pairs = set()
+        for ids in self._buckets.values():
+            for i, first in enumerate(ids):
+                for second in ids[i + 1:]:
+                    pairs.add((first, second) if first < second
+                              else (second, first))
+        return pairs
+
+    def pairs(self, threshold=DEDUPE_THRESHOLD):
+        # (first id, second id, similarity) of candidates whose trigram
+        # sets are at least `threshold` similar, most similar first.
+        found = []
+        cache = {}
+        for first, second in self.candidates():
+            for question_id in (first, second):
+                if question_id not in cache:
+                    cache[question_id] = shingles(self._texts[question_id])
+            similarity = jaccard(cache[first], cache[second])
+            if similarity >= threshold:
+                found.append((first, second, similarity))
+        found.sort(key=lambda pair: (-pair[2], pair[0], pair[1]))
+        return found
+
+
+def near_duplicates(threshold=DEDUPE_THRESHOLD, category=None):
+    # Near-duplicate question pairs across the bank (or one category).
+    index = NearDuplicateIndex()
+    rows = Question.query.with_entities(Question.id, Question.question)
+    if category is not None:
+        rows = rows.filter(Question.category == category)
+    for question_id, question in rows.yield_per(10000):
+        index.add(question_id, question)
+    return [
+        {"ids": [first, second], "similarity": round(similarity, 3)}
+        for first, second, similarity in index.pairs(threshold)
+    ]
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import abort, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_BUDGET = os.getenv('QUERY_BUDGET')
+# /internal/pool, /internal/snapshot and /metrics show pool state,
+# replica URLs and traffic, so they answer 404 unless enabled.
+INTERNAL_ENDPOINTS = os.getenv('INTERNAL_ENDPOINTS', 'false').lower() == 'true'
+
+METRICS = (
+    ("requests_total", "counter", "Requests served."),
+    ("db_queries_total", "counter", "Database queries issued."),
+    ("db_seconds_total", "counter", "Time spent in database queries."),
+    ("serialize_seconds_total", "counter", "Time spent encoding JSON."),
+    ("request_seconds_total", "counter", "Time spent handling requests."),
+    ("response_bytes_total", "counter", "Response body bytes sent."),
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+"""
+Engine events
+    every cursor execution inside an app context with timing enabled is
+    counted and timed into g.request_timing. The start time lives on the
+    statement's execution context (on the connection for the few
+    executions without one), so a statement that fails, and never gets
+    its after_cursor_execute, leaves nothing behind on the connection.
+"""
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    holder = conn.info if context is None else context.__dict__
+    holder["query_started"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    holder = conn.info if context is None else context.__dict__
+    started = holder.pop("query_started", None)
+    if started is None:
+        return
+    if has_app_context() and "request_timing" in g:
+        g.request_timing["queries"] += 1
+        g.request_timing["db"] += time.perf_counter() - started
+
+
+_engine_events = threading.Lock()
+
+
+def listen_to_engines():
+    with _engine_events:
+        if not event.contains(Engine, "before_cursor_execute",
+                              before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+def record_serialization(seconds):
+    if has_app_context() and "request_timing" in g:
+        g.request_timing["serialize"] += seconds
+
+
+def internal(view):
+    # Operator-only endpoints, off unless INTERNAL_ENDPOINTS.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config["INTERNAL_ENDPOINTS"]:
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+"""
+Instrumentation
+    per-request query count, database time, JSON serialization time and
+    response size. Each response carries them in a Server-Timing header,
+    totals per endpoint are served in Prometheus text format by
+    /metrics, and a request issuing more queries than its budget
+    (QUERY_BUDGETS[endpoint], else QUERY_BUDGET) raises
+    QueryBudgetExceeded when QUERY_BUDGET_STRICT (default: app.testing)
+    is set, or logs a warning otherwise.
+"""
+
+
+class Instrumentation:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.metrics = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "QUERY_BUDGET", int(QUERY_BUDGET) if QUERY_BUDGET else None)
+        app.config.setdefault("QUERY_BUDGETS", {})
+        app.config.setdefault("QUERY_BUDGET_STRICT", None)
+        app.config.setdefault("INTERNAL_ENDPOINTS", INTERNAL_ENDPOINTS)
+        listen_to_engines()
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        g.request_timing = {
+            "started": time.perf_counter(), "queries": 0, "db": 0.0,
+            "serialize": 0.0,
+        }
+
+    def finish(self, response):
+        timing = g.pop("request_timing", None)
+        if timing is None:
+            return response
+        elapsed = time.perf_counter() - timing["started"]
+        endpoint = request.endpoint or "unmatched"
+        size = 0 if response.is_streamed else response.calculate_content_length()
+
+        response.headers["Server-Timing"] = ", ".join([
+            'db;dur={:.2f};desc="{} queries"'.format(
+                timing["db"] * 1000, timing["queries"]),
+            "serialize;dur={:.2f}".format(timing["serialize"] * 1000),
+            "total;dur={:.2f}".format(elapsed * 1000),
+        ])
+        self.record(endpoint, timing, elapsed, size or 0)
+        self.check_budget(endpoint, timing["queries"])
+        return response
+
+    def record(self, endpoint, timing, elapsed, size):
+        with self._lock:
+            metrics = self.metrics.setdefault(
+                endpoint, dict.fromkeys([name for name, _, _ in METRICS], 0))
+            metrics["requests_total"] += 1
+            metrics["db_queries_total"] += timing["queries"]
+            metrics["db_seconds_total"] += timing["db"]
+            metrics["serialize_seconds_total"] += timing["serialize"]
+            metrics["request_seconds_total"] += elapsed
+            metrics["response_bytes_total"] += size
+
+    def check_budget(self, endpoint, queries):
+        config = current_app.config
+        budget = config["QUERY_BUDGETS"].get(endpoint, config["QUERY_BUDGET"])
+        if budget is None or queries <= budget:
+            return
+        message = "{} issued {} queries, over its budget of {}".format(
+            endpoint, queries, budget)
+        strict = config["QUERY_BUDGET_STRICT"]
+        if strict or (strict is None and current_app.testing):
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for name, kind, description in METRICS:
+                lines.append("# HELP trivia_{} {}".format(name, description))
+                lines.append("# TYPE trivia_{} {}".format(name, kind))
+                for endpoint, metrics in sorted(self.metrics.items()):
+                    lines.append('trivia_{}{{endpoint="{}"}} {}'.format(
+                        name, endpoint, metrics[name]))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,152 @@
+import base64
+import binascii
+import os
+
+from flask import abort
+
+from models import Question
+
+QUESTIONS_PER_PAGE = 10
+# Largest ?per_page= a client may ask for.
+QUESTIONS_MAX_PER_PAGE = int(os.getenv('QUESTIONS_MAX_PER_PAGE', 100))
+
+# Columns of Question.format(), selected directly so read paths build
+# plain dicts from row tuples without loading ORM instances.
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+QUIZ_COLUMNS = (Question.id, Question.question, Question.answer)
+FIELDS = {column.key: column for column in QUESTION_COLUMNS}
+
+
+"""
+encode_cursor(question_id) / decode_cursor(cursor)
+    opaque keyset cursor pointing just after the given question id
+"""
+
+
+def encode_cursor(question_id):
+    token = "q:{}".format(question_id).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        prefix, question_id = base64.urlsafe_b64decode(
+            padded.encode()).decode().split(":", 1)
+        if prefix != "q":
+            raise ValueError(cursor)
+        return int(question_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(400)
+
+
+def _int_arg(request, name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        return default
+
+
+"""
+page_size(request)
+    ?per_page= capped at QUESTIONS_MAX_PER_PAGE, QUESTIONS_PER_PAGE when
+    it is missing; zero or negative sizes are a 400
+"""
+
+
+def page_size(request):
+    per_page = _int_arg(request, "per_page", QUESTIONS_PER_PAGE)
+    if per_page < 1:
+        abort(400)
+    return min(per_page, QUESTIONS_MAX_PER_PAGE)
+
+
+def page_offset(request):
+    page = _int_arg(request, "page", 1)
+    if page < 1:
+        return None
+    return (page - 1) * page_size(request)
+
+
+"""
+question_columns(request)
+    the columns named by ?fields=id,question,... in Question.format()
+    order, or all of them. `id` is always included so cursors and
+    follow-up requests keep working; unknown fields are a 400.
+"""
+
+
+def question_columns(request):
+    fields = request.args.get("fields")
+    if not fields:
+        return QUESTION_COLUMNS
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    if not names <= FIELDS.keys():
+        abort(400)
+    names.add("id")
+    return tuple(column for column in QUESTION_COLUMNS if column.key in names)
+
+
+"""
+question_rows(selection, columns=QUESTION_COLUMNS)
+    runs a Question query selecting only `columns` and returns each row
+    as a dict, shaped like Question.format() for the default columns
+"""
+
+
+def question_rows(selection, columns=QUESTION_COLUMNS):
+    return [row._asdict() for row in selection.with_entities(*columns)]
+
+
+"""
+page_window(request) / paged(selection, window)
+    the page a request asks for, as (after, offset, limit): `?cursor=`
+    switches to keyset pagination after the id `after`, `?page=` skips
+    `offset` rows, `?per_page=` sets `limit`; None for a page number
+    below 1. paged() applies it to a Question query or a select()
+    ordered by Question.id, for the sync and the async app alike.
+"""
+
+
+def page_window(request):
+    cursor = request.args.get("cursor", None)
+    if cursor:
+        return decode_cursor(cursor), None, page_size(request)
+    offset = page_offset(request)
+    if offset is None:
+        return None
+    return None, offset, page_size(request)
+
+
+def paged(selection, window):
+    after, offset, limit = window
+    if after is not None:
+        selection = selection.filter(Question.id > after)
+    else:
+        selection = selection.offset(offset)
+    return selection.limit(limit)
+
+
+"""
+paginate_questions(request, selection)
+    applies the page window to a Question query (ordered by Question.id)
+    in the database and returns the rows of that page as dicts, with the
+    columns `?fields=` selects
+"""
+
+
+def paginate_questions(request, selection):
+    window = page_window(request)
+    if window is None:
+        return []
+    return question_rows(paged(selection, window), question_columns(request))
+
+
+def next_cursor(current_questions, per_page=QUESTIONS_PER_PAGE):
+    if len(current_questions) < per_page:
+        return None
+    return encode_cursor(current_questions[-1]["id"])
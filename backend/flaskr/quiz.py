@@ -0,0 +1,324 @@
+import math
+import random
+import threading
+import zlib
+
+from flask import abort
+from sqlalchemy import select
+
+from models import db, on_question_change, question_fingerprint, Question
+from .pagination import QUIZ_COLUMNS
+
+# Rejection sampling attempts before falling back to a scan of the bucket.
+SAMPLE_ATTEMPTS = 8
+FEISTEL_ROUNDS = 4
+
+
+"""
+IdBucket
+    question ids with O(1) add, remove and uniform random choice
+"""
+
+
+class IdBucket:
+    __slots__ = ("ids", "positions")
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, question_id):
+        return question_id in self.positions
+
+    def add(self, question_id):
+        if question_id in self.positions:
+            return
+        self.positions[question_id] = len(self.ids)
+        self.ids.append(question_id)
+
+    def remove(self, question_id):
+        position = self.positions.pop(question_id, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if last != question_id:
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def choice(self, exclude=frozenset(), rng=random):
+        if not self.ids:
+            return None
+        for _ in range(SAMPLE_ATTEMPTS):
+            question_id = self.ids[rng.randrange(len(self.ids))]
+            if question_id not in exclude:
+                return question_id
+        candidates = [i for i in self.ids if i not in exclude]
+        return rng.choice(candidates) if candidates else None
+
+
+"""
+QuestionIndex
+    question ids bucketed by category and by (category, difficulty),
+    with None standing for "any" on either side. sample() draws from the
+    requested bucket or, given a target difficulty, from the nearest
+    difficulty level of the category that still has a question outside
+    `exclude` (ties go to the easier level). Difficulty levels are few,
+    so picking the level is constant time. max_id is the largest id
+    ever added.
+"""
+
+
+class QuestionIndex:
+    __slots__ = ("buckets", "levels", "max_id")
+
+    def __init__(self):
+        self.buckets = {}
+        self.levels = {}
+        self.max_id = 0
+
+    @staticmethod
+    def statement():
+        return select(Question.id, Question.category, Question.difficulty)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows of statement()
+        index = cls()
+        for question_id, category, difficulty in rows:
+            index.add(question_id, category, difficulty)
+        return index
+
+    @staticmethod
+    def _keys(category, difficulty):
+        keys = [(None, None), (category, None)]
+        if difficulty is not None:
+            keys += [(None, difficulty), (category, difficulty)]
+        return keys
+
+    def add(self, question_id, category, difficulty):
+        self.max_id = max(self.max_id, question_id)
+        for key in self._keys(category, difficulty):
+            self.buckets.setdefault(key, IdBucket()).add(question_id)
+            if key[1] is not None:
+                self.levels.setdefault(key[0], set()).add(key[1])
+
+    def remove(self, question_id, category, difficulty):
+        for key in self._keys(category, difficulty):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.remove(question_id)
+
+    def discard(self, question_id):
+        for bucket in self.buckets.values():
+            bucket.remove(question_id)
+
+    def bucket(self, category=None, difficulty=None):
+        return self.buckets.get((category, difficulty))
+
+    def sample(self, category=None, exclude=frozenset(), difficulty=None):
+        if difficulty is None:
+            bucket = self.bucket(category)
+            return bucket.choice(exclude) if bucket else None
+        levels = sorted(self.levels.get(category, ()),
+                        key=lambda level: (abs(level - difficulty), level))
+        for level in levels:
+            bucket = self.buckets[(category, level)]
+            question_id = bucket.choice(exclude) if bucket else None
+            if question_id is not None:
+                return question_id
+        return None
+
+
+"""
+QuestionSampler
+    the QuestionIndex of every question, loaded once with a single
+    (id, category, difficulty) query and kept current by
+    Question.insert/delete. sample() picks a question id outside
+    `exclude`, optionally near a target difficulty, without touching
+    the database.
+"""
+
+
+class QuestionSampler:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._index = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        on_question_change(app, self._apply)
+
+    def load(self):
+        index = QuestionIndex.from_rows(
+            db.session.execute(QuestionIndex.statement()))
+        with self._lock:
+            self._index = index
+
+    def _apply(self, event, question):
+        with self._lock:
+            if self._index is None:
+                return
+            if event == "reset":
+                self._index = None
+                return
+            question_id = question["id"]
+            category, difficulty = (
+                None if value is None else int(value)
+                for value in (question["category"], question["difficulty"]))
+            if event == "insert":
+                self._index.add(question_id, category, difficulty)
+            elif event == "delete":
+                self._index.remove(question_id, category, difficulty)
+
+    def _loaded(self):
+        index = self._index
+        if index is None:
+            self.load()
+            index = self._index
+        return index
+
+    def discard(self, question_id):
+        with self._lock:
+            if self._index is not None:
+                self._index.discard(question_id)
+
+    def contains(self, question_id, category=None):
+        index = self._loaded()
+        with self._lock:
+            bucket = index.bucket(category)
+            return bool(bucket) and question_id in bucket
+
+    def max_id(self):
+        return self._loaded().max_id
+
+    def count(self, category=None):
+        index = self._loaded()
+        with self._lock:
+            bucket = index.bucket(category)
+            return len(bucket) if bucket else 0
+
+    def sample(self, category=None, exclude=frozenset(), difficulty=None):
+        index = self._loaded()
+        with self._lock:
+            return index.sample(category, exclude, difficulty)
+
+
+"""
+IdPermutation
+    a pseudo-random permutation of range(size), keyed by `seed`, read
+    one position at a time: a balanced Feistel network over the smallest
+    even number of bits that covers size, applied again to values past
+    the end (cycle walking, under four times on average). Quiz sessions
+    keep a seed and a position instead of a shuffled list of ids.
+"""
+
+
+class IdPermutation:
+    __slots__ = ("size", "half", "mask", "keys")
+
+    def __init__(self, seed, size):
+        self.size = size
+        self.half = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(32) for _ in range(FEISTEL_ROUNDS)]
+
+    def _encrypt(self, value):
+        left, right = value >> self.half, value & self.mask
+        for key in self.keys:
+            left, right = right, left ^ (
+                zlib.crc32(right.to_bytes(8, "little"), key) & self.mask)
+        return (left << self.half) | right
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+"""
+next_permuted_id(sampler, session)
+    the next question of a permutation quiz session, a dict of the
+    `seed`, `category`, `size` (max id + 1 when it started), `total`,
+    `position` and `served` kept by the session stores: walks the
+    session's permutation of ids from `position`, skipping ids that
+    aren't (or are no longer) questions of the category. Returns
+    (question id or None once every question was served, next position).
+"""
+
+
+def next_permuted_id(sampler, session):
+    order = IdPermutation(session["seed"], session["size"])
+    position = session["position"]
+    while position < len(order) and session["served"] < session["total"]:
+        question_id = order[position]
+        position += 1
+        if sampler.contains(question_id, session["category"]):
+            return question_id, position
+    return None, position
+
+
+"""
+Ratings
+    adaptive quizzes track a rating on the difficulty scale; a correct
+    answer moves it RATING_STEP up, a wrong one RATING_STEP down, and
+    the next question is drawn near round(rating)
+"""
+
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+INITIAL_RATING = 3.0
+RATING_STEP = 0.5
+
+
+def target_difficulty(rating):
+    level = int(math.floor(rating + 0.5))
+    return min(MAX_DIFFICULTY, max(MIN_DIFFICULTY, level))
+
+
+def next_rating(rating, correct):
+    rating += RATING_STEP if correct else -RATING_STEP
+    return min(float(MAX_DIFFICULTY), max(float(MIN_DIFFICULTY), rating))
+
+
+"""
+Quiz queries, shared by the sync app and the async one (flaskr.asgi)
+    previous_questions hold question ids, or the question texts older
+    clients send, which are matched by fingerprint so they hit its
+    index (anything else is a 400); quiz questions are selected column
+    by column as plain rows
+"""
+
+
+def split_previous_questions(previous_questions):
+    # (ids, fingerprints of the texts)
+    if not isinstance(previous_questions, list):
+        abort(400)
+    ids, fingerprints = set(), set()
+    for question in previous_questions:
+        if isinstance(question, str):
+            fingerprints.add(question_fingerprint(question))
+        elif isinstance(question, int) and not isinstance(question, bool):
+            ids.add(question)
+        else:
+            abort(400)
+    return ids, fingerprints
+
+
+def ids_with_fingerprints(fingerprints):
+    return select(Question.id).where(Question.fingerprint.in_(fingerprints))
+
+
+def quiz_question_statement(question_id, columns=QUIZ_COLUMNS):
+    return select(*columns).where(Question.id == question_id)
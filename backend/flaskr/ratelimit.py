@@ -0,0 +1,194 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from .serialization import jsonify
+
+RATE_LIMIT = os.getenv('RATE_LIMIT')
+RATE_LIMIT_BURST = os.getenv('RATE_LIMIT_BURST')
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+# Comma separated API keys that get a bucket of their own.
+RATE_LIMIT_API_KEYS = os.getenv('RATE_LIMIT_API_KEYS')
+# Reverse proxies in front of the app whose X-Forwarded-For is trusted.
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', 0))
+
+API_KEY_HEADER = "X-API-Key"
+
+# Tokens charged per request by endpoint; anything else costs 1. Search
+# and quiz requests do the most database work, and a batch runs up to
+# BATCH_MAX_REQUESTS reads. Searches through POST /questions pay the
+# search_questions cost from the view (RateLimiter.charge).
+ENDPOINT_COSTS = {
+    "search_questions": 5,
+    "get_quiz": 3,
+    "create_quiz_session": 3,
+    "bulk_import_questions": 20,
+    "export_all_questions": 20,
+    "run_batch": 10,
+    "retrieve_near_duplicates": 50,
+}
+
+
+"""
+Token bucket stores
+    take(key, cost, rate, burst) refills the bucket of `key` at `rate`
+    tokens per second up to `burst`, and takes `cost` tokens from it if
+    there are enough. Returns 0 when the request is admitted, otherwise
+    the seconds to wait until it would be.
+"""
+
+
+class MemoryBucketStore:
+    """Buckets of this process, least recently used ones dropped first."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, rate, burst):
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RedisBucketStore:
+    """
+    Buckets shared between workers in Redis: one hash per key, updated
+    atomically by a Lua script and expiring once it would be full again.
+    """
+
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local now = tonumber(ARGV[4])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+        else
+            wait = (cost - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, client, prefix='trivia:ratelimit:', clock=time.time):
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+
+    def take(self, key, cost, rate, burst):
+        wait = self.client.eval(self.SCRIPT, 1, self.prefix + key,
+                                rate, burst, cost, self.clock())
+        return float(wait)
+
+
+def create_bucket_store():
+    if RATE_LIMIT_REDIS_URL:
+        import redis
+        return RedisBucketStore(redis.Redis.from_url(RATE_LIMIT_REDIS_URL))
+    return MemoryBucketStore()
+
+
+"""
+RateLimiter
+    admission control run before every request: clients, identified by
+    their X-API-Key header when it is one of RATE_LIMIT_API_KEYS (so
+    rotating made-up keys doesn't buy fresh buckets) or else by their
+    address, taken from X-Forwarded-For behind TRUSTED_PROXIES proxies,
+    get a token bucket
+    refilling RATE_LIMIT tokens per second up to RATE_LIMIT_BURST
+    (default: 10 seconds' worth). Each request costs RATE_LIMIT_COSTS
+    [endpoint] tokens, and one that can't pay is answered with a 429
+    and a Retry-After header. Off while RATE_LIMIT is unset. Views whose
+    cost depends on the body call charge(endpoint) to pay the rest of
+    that endpoint's cost.
+"""
+
+
+class RateLimiter:
+
+    def __init__(self, app=None, store=None):
+        self.store = store
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            "RATE_LIMIT", float(RATE_LIMIT) if RATE_LIMIT else None)
+        app.config.setdefault(
+            "RATE_LIMIT_BURST", float(RATE_LIMIT_BURST) if RATE_LIMIT_BURST else None)
+        app.config.setdefault("RATE_LIMIT_COSTS", dict(ENDPOINT_COSTS))
+        app.config.setdefault("RATE_LIMIT_API_KEYS", frozenset(
+            key.strip() for key in (RATE_LIMIT_API_KEYS or "").split(",")
+            if key.strip()))
+        app.config.setdefault("TRUSTED_PROXIES", TRUSTED_PROXIES)
+        if app.config["TRUSTED_PROXIES"]:
+            app.wsgi_app = ProxyFix(
+                app.wsgi_app, x_for=app.config["TRUSTED_PROXIES"])
+        if self.store is None:
+            self.store = create_bucket_store()
+        app.extensions["rate_limiter"] = self
+        app.before_request(self.admit)
+
+    def client_key(self):
+        api_key = request.headers.get(API_KEY_HEADER)
+        if api_key and api_key in current_app.config["RATE_LIMIT_API_KEYS"]:
+            return "key:" + api_key
+        return "ip:" + (request.remote_addr or "unknown")
+
+    def admit(self):
+        return self._take(request.endpoint)
+
+    def charge(self, endpoint):
+        # The tokens of `endpoint` beyond those admit() took for this
+        # request; a 429 response when they can't be paid, else None.
+        return self._take(endpoint, paid=request.endpoint)
+
+    def _take(self, endpoint, paid=None):
+        config = current_app.config
+        rate = config["RATE_LIMIT"]
+        if not rate:
+            return None
+        burst = config["RATE_LIMIT_BURST"] or rate * 10
+        costs = config["RATE_LIMIT_COSTS"]
+        cost = min(burst, costs.get(endpoint, 1))
+        if paid is not None:
+            cost -= min(burst, costs.get(paid, 1))
+        if cost <= 0:
+            return None
+        wait = self.store.take(self.client_key(), cost, rate, burst)
+        if not wait:
+            return None
+
+        response = jsonify({
+            "success": False,
+            "error": 429,
+            "message": "too many requests"
+        })
+        response.status_code = 429
+        response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+        return response
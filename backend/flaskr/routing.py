@@ -0,0 +1,100 @@
+import os
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from models import db, RoutingSession
+
+# Seconds after a write during which the same client reads from the
+# primary, so it sees its own changes despite replication lag.
+DB_READ_YOUR_WRITES = float(os.getenv('DB_READ_YOUR_WRITES', 5))
+
+PRIMARY_COOKIE = "read_primary_until"
+PRIMARY_HEADER = "X-Read-Primary-Until"
+
+def _flushed(session, context):
+    session.info["wrote"] = True
+
+
+def _committed(session):
+    # Marks the request as a write once something it flushed commits.
+    if session.info.pop("wrote", False) and has_request_context():
+        g.db_wrote = True
+
+
+def _rolled_back(session):
+    session.info.pop("wrote", None)
+
+
+"""
+ReplicaRouting
+    marks requests for the RoutingSession in models: views decorated
+    with read_only run their queries on a read replica, unless the
+    client wrote within the last DB_READ_YOUR_WRITES seconds. A view
+    whose replica fails to connect is run again on the primary. Responses
+    to requests that committed a write (not merely a non-GET request,
+    since errors are answered with status 200 too) carry the end of that
+    window as a cookie and as a header, for clients without cookies to
+    send back.
+"""
+
+
+class ReplicaRouting:
+
+    def __init__(self, app=None, window=DB_READ_YOUR_WRITES):
+        self.window = window
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.forget)
+        app.after_request(self.remember_write)
+        for name, listener in (("after_flush", _flushed),
+                               ("after_commit", _committed),
+                               ("after_rollback", _rolled_back)):
+            if not event.contains(RoutingSession, name, listener):
+                event.listen(RoutingSession, name, listener)
+
+    def forget(self):
+        # g outlives a request when its app context was pushed already,
+        # as in the tests.
+        for name in ("db_read_only", "db_replica", "db_wrote"):
+            g.pop(name, None)
+
+    def read_only(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.db_read_only = not self.recently_wrote()
+            try:
+                return view(*args, **kwargs)
+            except OperationalError:
+                # Only retry when the error ejected the replica.
+                replica = g.get("db_replica")
+                replicas = current_app.extensions.get("db_replicas")
+                if replica is None or replicas.healthy(replica):
+                    raise
+            db.session.rollback()
+            g.db_replica = None
+            return view(*args, **kwargs)
+        wrapper.read_only = True
+        return wrapper
+
+    def recently_wrote(self):
+        until = request.headers.get(PRIMARY_HEADER) or \
+            request.cookies.get(PRIMARY_COOKIE)
+        try:
+            return float(until) > time.time()
+        except (TypeError, ValueError):
+            return False
+
+    def remember_write(self, response):
+        if self.window <= 0 or not g.get("db_wrote"):
+            return response
+        until = "{:.3f}".format(time.time() + self.window)
+        response.set_cookie(PRIMARY_COOKIE, until, max_age=int(self.window) + 1,
+                            httponly=True, samesite="Lax")
+        response.headers[PRIMARY_HEADER] = until
+        return response
@@ -0,0 +1,178 @@
+import bisect
+import re
+import threading
+
+from sqlalchemy import func, inspect, literal_column
+
+from models import db, on_question_change, Question
+from .pagination import QUESTION_COLUMNS, question_rows
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Matches in the question text rank above matches in the answer.
+QUESTION_WEIGHT = 2
+ANSWER_WEIGHT = 1
+
+
+def tokenize(text):
+    return TOKEN.findall((text or "").lower())
+
+
+"""
+PostgresSearch
+    full-text search on the question_tsv/answer_tsv generated columns and
+    their GIN indexes (see migrations/versions/0001_question_search.py).
+    The last search term matches as a prefix so results follow the
+    search box as the user types.
+"""
+
+
+class PostgresSearch:
+
+    def __init__(self, config="english"):
+        self.config = config
+        self.question_tsv = literal_column("questions.question_tsv")
+        self.answer_tsv = literal_column("questions.answer_tsv")
+
+    def search(self, term, answers=False, offset=0, limit=10,
+               columns=QUESTION_COLUMNS):
+        terms = tokenize(term)
+        if not terms:
+            return [], 0
+        query = func.to_tsquery(
+            self.config, " & ".join(terms[:-1] + [terms[-1] + ":*"]))
+
+        match = self.question_tsv.op("@@")(query)
+        rank = func.ts_rank(self.question_tsv, query) * QUESTION_WEIGHT
+        if answers:
+            match = match | self.answer_tsv.op("@@")(query)
+            rank = rank + func.ts_rank(self.answer_tsv, query) * ANSWER_WEIGHT
+
+        selection = Question.query.filter(match)
+        total = selection.count()
+        page = question_rows(selection.order_by(rank.desc(), Question.id).offset(
+            offset).limit(limit), columns)
+        return page, total
+
+
+"""
+InvertedIndexSearch
+    pure-Python fallback for databases without full-text search (SQLite).
+    Postings are loaded with one scan of the questions table and kept
+    current by Question.insert/delete. Every term has to match; the last
+    one as a prefix.
+"""
+
+
+class InvertedIndexSearch:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._documents = None
+        if app is not None:
+            on_question_change(app, self._apply)
+
+    def load(self):
+        with self._lock:
+            self._documents = {}
+            self._postings = ({}, {})
+            self._vocabulary = []
+            self._known = set()
+            rows = Question.query.with_entities(
+                Question.id, Question.question, Question.answer)
+            for question_id, question, answer in rows:
+                self._add(question_id, question, answer)
+
+    def _add(self, question_id, question, answer):
+        fields = (frozenset(tokenize(question)), frozenset(tokenize(answer)))
+        self._documents[question_id] = fields
+        for postings, tokens in zip(self._postings, fields):
+            for token in tokens:
+                if token not in postings:
+                    postings[token] = set()
+                    if token not in self._known:
+                        self._known.add(token)
+                        bisect.insort(self._vocabulary, token)
+                postings[token].add(question_id)
+
+    def _remove(self, question_id):
+        fields = self._documents.pop(question_id, None)
+        if fields is None:
+            return
+        for postings, tokens in zip(self._postings, fields):
+            for token in tokens:
+                postings[token].discard(question_id)
+
+    def _apply(self, event, question):
+        with self._lock:
+            if self._documents is None:
+                return
+            if event == "reset":
+                self._documents = None
+            elif event == "insert":
+                self._add(question["id"], question["question"],
+                          question["answer"])
+            elif event == "delete":
+                self._remove(question["id"])
+
+    def _prefixed(self, prefix):
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and \
+                self._vocabulary[position].startswith(prefix):
+            yield self._vocabulary[position]
+            position += 1
+
+    def _scores(self, tokens, answers):
+        fields = self._postings if answers else self._postings[:1]
+        weights = (QUESTION_WEIGHT, ANSWER_WEIGHT)
+        scores = {}
+        for postings, weight in zip(fields, weights):
+            matched = set()
+            for token in tokens:
+                matched.update(postings.get(token, ()))
+            for question_id in matched:
+                scores[question_id] = scores.get(question_id, 0) + weight
+        return scores
+
+    def rank(self, term, answers=False):
+        terms = tokenize(term)
+        if not terms:
+            return []
+        if self._documents is None:
+            self.load()
+        with self._lock:
+            matched = None
+            scores = {}
+            for position, term in enumerate(terms):
+                if position == len(terms) - 1:
+                    tokens = list(self._prefixed(term))
+                else:
+                    tokens = [term]
+                term_scores = self._scores(tokens, answers)
+                if matched is None:
+                    matched = set(term_scores)
+                else:
+                    matched &= term_scores.keys()
+                for question_id, score in term_scores.items():
+                    scores[question_id] = scores.get(question_id, 0) + score
+        return sorted(matched, key=lambda i: (-scores[i], i))
+
+    def search(self, term, answers=False, offset=0, limit=10,
+               columns=QUESTION_COLUMNS):
+        ranked = self.rank(term, answers)
+        page_ids = ranked[offset:offset + limit]
+        questions = {
+            question["id"]: question for question in question_rows(
+                Question.query.filter(Question.id.in_(page_ids)), columns)
+        }
+        page = [questions[i] for i in page_ids if i in questions]
+        return page, len(ranked)
+
+
+def create_search(app):
+    with app.app_context():
+        if db.engine.dialect.name == "postgresql":
+            columns = inspect(db.engine).get_columns("questions")
+            if "question_tsv" in {column["name"] for column in columns}:
+                return PostgresSearch()
+    return InvertedIndexSearch(app)
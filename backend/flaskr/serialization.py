@@ -0,0 +1,88 @@
+import decimal
+import json
+import os
+import time
+
+from flask import current_app
+
+from .instrumentation import record_serialization
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+
+
+def _default(o):
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(
+        "Object of type {} is not JSON serializable".format(type(o).__name__))
+
+
+"""
+JSON providers
+    encode response payloads to bytes. OrjsonProvider is used when orjson
+    is installed (JSON_PROVIDER=auto), StdlibJSONProvider otherwise; both
+    honour JSON_SORT_KEYS.
+"""
+
+
+class StdlibJSONProvider:
+    name = "json"
+
+    def __init__(self, sort_keys=True):
+        self.sort_keys = sort_keys
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":"), sort_keys=self.sort_keys,
+                          default=_default).encode()
+
+
+class OrjsonProvider:
+    name = "orjson"
+
+    def __init__(self, sort_keys=True):
+        self.option = orjson.OPT_SORT_KEYS if sort_keys else 0
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=_default, option=self.option)
+
+
+PROVIDERS = {"json": StdlibJSONProvider, "orjson": OrjsonProvider}
+
+
+def create_provider(provider=JSON_PROVIDER, sort_keys=True):
+    if provider == "auto":
+        provider = "orjson" if orjson is not None else "json"
+    return PROVIDERS[provider](sort_keys=sort_keys)
+
+
+def init_json(app, provider=JSON_PROVIDER):
+    app.extensions["json_provider"] = create_provider(
+        provider, sort_keys=app.config["JSON_SORT_KEYS"])
+
+
+def dumps(obj):
+    started = time.perf_counter()
+    body = current_app.extensions["json_provider"].dumps(obj)
+    record_serialization(time.perf_counter() - started)
+    return body
+
+
+"""
+jsonify(obj)
+    drop-in for flask.jsonify that encodes with the app's JSON provider
+"""
+
+
+def jsonify(*args, **kwargs):
+    if args and kwargs:
+        raise TypeError("jsonify() takes either a payload or keywords")
+    obj = args[0] if len(args) == 1 else (args or kwargs)
+    return current_app.response_class(
+        dumps(obj) + b"\n", mimetype=current_app.config["JSONIFY_MIMETYPE"])
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+QUIZ_SESSION_TTL = int(os.getenv('QUIZ_SESSION_TTL', 3600))
+QUIZ_SESSION_MAX = int(os.getenv('QUIZ_SESSION_MAX', 10000))
+QUIZ_SESSION_REDIS_URL = os.getenv('QUIZ_SESSION_REDIS_URL')
+
+
+"""
+Quiz session stores
+    hold the state of a permutation quiz session, a few integers that
+    let flaskr.quiz.next_permuted_id() walk a shuffled order of the
+    question ids without storing it (seed, category, size, total,
+    position, served), or of an adaptive session (its category, current
+    rating and the ids already asked). Both stores implement
+
+        create(session_id, seed, category, size, total)
+        advance(session_id, pick) -> (question_id, remaining)
+        create_adaptive(session_id, category, rating)
+        adaptive(session_id) -> (category, rating, seen) or None
+        record(session_id, question_id, rating)
+
+    advance() calls pick(state) -> (question_id, position) and saves the
+    new position; it returns a question_id of None once the permutation
+    is used up. adaptive() returns None for a permutation session, and
+    all of them raise KeyError for unknown or expired sessions.
+"""
+
+SESSION_FIELDS = ("seed", "category", "size", "total", "position", "served")
+
+
+class MemorySessionStore:
+    """In-process LRU of sessions with a sliding TTL."""
+
+    def __init__(self, max_sessions=QUIZ_SESSION_MAX, ttl=QUIZ_SESSION_TTL,
+                 clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def _put(self, session_id, session):
+        now = self.clock()
+        with self._lock:
+            self._sessions[session_id] = [now + self.ttl, session]
+            self._evict(now)
+
+    def _touch(self, session_id):
+        # Call with the lock held.
+        now = self.clock()
+        self._evict(now)
+        entry = self._sessions[session_id]
+        self._sessions.move_to_end(session_id)
+        entry[0] = now + self.ttl
+        return entry[1]
+
+    def create(self, session_id, seed, category, size, total):
+        self._put(session_id, {"seed": seed, "category": category,
+                               "size": size, "total": total,
+                               "position": 0, "served": 0})
+
+    def advance(self, session_id, pick):
+        with self._lock:
+            session = self._touch(session_id)
+            if "seed" not in session:
+                raise KeyError(session_id)
+            question_id, session["position"] = pick(session)
+            if question_id is None:
+                return None, 0
+            session["served"] += 1
+            return question_id, max(0, session["total"] - session["served"])
+
+    def create_adaptive(self, session_id, category, rating):
+        self._put(session_id,
+                  {"category": category, "rating": rating, "seen": set()})
+
+    def adaptive(self, session_id):
+        with self._lock:
+            session = self._touch(session_id)
+            if "seen" not in session:
+                return None
+            return session["category"], session["rating"], set(session["seen"])
+
+    def record(self, session_id, question_id, rating):
+        with self._lock:
+            session = self._touch(session_id)
+            session["rating"] = rating
+            if question_id is not None:
+                session["seen"].add(question_id)
+
+
+class RedisSessionStore:
+    """
+    Sessions kept in Redis (or anything with the same hash commands): a
+    hash of the session state next to a marker key that tells a session
+    apart from an expired one. Concurrent rounds of one session may both
+    get the same question; clients ask for one round at a time.
+    """
+
+    def __init__(self, client, ttl=QUIZ_SESSION_TTL, prefix='trivia:quiz:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        key = self.prefix + session_id
+        return key, key + ':order'
+
+    def create(self, session_id, seed, category, size, total):
+        marker, order = self._keys(session_id)
+        self.client.set(marker, 1, ex=self.ttl)
+        self.client.hset(order, mapping={
+            "seed": seed,
+            "category": "" if category is None else category,
+            "size": size,
+            "total": total,
+            "position": 0,
+            "served": 0,
+        })
+        self.client.expire(order, self.ttl)
+
+    def advance(self, session_id, pick):
+        marker, order = self._keys(session_id)
+        if not self.client.expire(marker, self.ttl):
+            raise KeyError(session_id)
+        fields = self.client.hgetall(order)
+        if not fields:
+            raise KeyError(session_id)
+        session = {name: int(fields[name.encode()]) if fields[name.encode()]
+                   else None for name in SESSION_FIELDS}
+        question_id, position = pick(session)
+        served = session["served"] + (question_id is not None)
+        self.client.hset(order, mapping={"position": position,
+                                         "served": served})
+        self.client.expire(order, self.ttl)
+        if question_id is None:
+            return None, 0
+        return question_id, max(0, session["total"] - served)
+
+    def _adaptive_keys(self, session_id):
+        key = self.prefix + session_id
+        return key + ':state', key + ':seen'
+
+    def create_adaptive(self, session_id, category, rating):
+        marker, _ = self._keys(session_id)
+        state, _ = self._adaptive_keys(session_id)
+        self.client.set(marker, 1, ex=self.ttl)
+        self.client.hset(state, mapping={
+            "category": "" if category is None else category,
+            "rating": rating,
+        })
+        self.client.expire(state, self.ttl)
+
+    def adaptive(self, session_id):
+        marker, _ = self._keys(session_id)
+        state, seen = self._adaptive_keys(session_id)
+        if not self.client.expire(marker, self.ttl):
+            raise KeyError(session_id)
+        fields = self.client.hgetall(state)
+        if not fields:
+            return None
+        self.client.expire(state, self.ttl)
+        self.client.expire(seen, self.ttl)
+        category = fields.get(b"category", b"")
+        return (int(category) if category else None,
+                float(fields[b"rating"]),
+                {int(question_id) for question_id in self.client.smembers(seen)})
+
+    def record(self, session_id, question_id, rating):
+        state, seen = self._adaptive_keys(session_id)
+        self.client.hset(state, "rating", rating)
+        if question_id is not None:
+            self.client.sadd(seen, question_id)
+            self.client.expire(seen, self.ttl)
+
+
+def create_session_store():
+    if QUIZ_SESSION_REDIS_URL:
+        import redis
+        return RedisSessionStore(redis.Redis.from_url(QUIZ_SESSION_REDIS_URL))
+    return MemorySessionStore()
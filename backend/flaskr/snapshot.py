@@ -0,0 +1,368 @@
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, on_question_change, Question, QuestionChange
+from .pagination import (QUESTION_COLUMNS, decode_cursor, page_offset,
+                         page_size, question_columns)
+
+QUESTION_SNAPSHOT = os.getenv('QUESTION_SNAPSHOT', 'false').lower() == 'true'
+QUESTION_SNAPSHOT_PATH = os.getenv('QUESTION_SNAPSHOT_PATH')
+# Pending inserts/deletes before the columns are rebuilt in memory.
+SNAPSHOT_COMPACT_AFTER = int(os.getenv('SNAPSHOT_COMPACT_AFTER', 1000))
+
+FIELDS = ("id", "question", "answer", "category", "difficulty")
+NO_CATEGORY = -1
+NO_DIFFICULTY = 0
+
+# magic, rows, text bytes, largest id, change log version
+HEADER = struct.Struct("<8sQQQQ")
+MAGIC = b"TRIVSNP2"
+
+
+"""
+Columns
+    one immutable generation of the question bank, column by column:
+    sorted ids, categories and difficulties in typed arrays, and every
+    question and answer text in one UTF-8 buffer addressed by offsets.
+    It can be saved to a file and mapped back read-only, so processes
+    mapping the same file share its pages. `version` is the change log
+    version (models.QuestionChange) the rows were read at.
+"""
+
+
+class Columns:
+    __slots__ = ("ids", "categories", "difficulties", "offsets", "text",
+                 "by_category", "mapped", "version")
+
+    def __init__(self, ids, categories, difficulties, offsets, text,
+                 mapped=False, version=0):
+        self.ids = ids
+        self.categories = categories
+        self.difficulties = difficulties
+        self.offsets = offsets
+        self.text = text
+        self.mapped = mapped
+        self.version = version
+        self.by_category = {}
+        for position, category in enumerate(categories):
+            if category not in self.by_category:
+                self.by_category[category] = array('l')
+            self.by_category[category].append(position)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def max_id(self):
+        return self.ids[-1] if len(self.ids) else 0
+
+    @classmethod
+    def from_rows(cls, rows, version=0):
+        # rows of (id, question, answer, category, difficulty) by id
+        ids, categories, difficulties = array('q'), array('i'), array('b')
+        offsets, text = array('Q', [0]), bytearray()
+        for question_id, question, answer, category, difficulty in rows:
+            ids.append(question_id)
+            categories.append(NO_CATEGORY if category is None else category)
+            difficulties.append(
+                NO_DIFFICULTY if difficulty is None else difficulty)
+            text += (question or "").encode()
+            offsets.append(len(text))
+            text += (answer or "").encode()
+            offsets.append(len(text))
+        return cls(ids, categories, difficulties, offsets, bytes(text),
+                   version=version)
+
+    def save(self, path):
+        partial = path + ".partial"
+        with open(partial, "wb") as file:
+            file.write(HEADER.pack(MAGIC, len(self), len(self.text),
+                                   self.max_id, self.version))
+            for column in (self.ids, self.offsets, self.categories,
+                           self.difficulties):
+                file.write(column.tobytes())
+            file.write(self.text)
+        os.replace(partial, path)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as file:
+            buffer = memoryview(mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, rows, text_size, _, version = HEADER.unpack(
+            buffer[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError("{} is not a question snapshot".format(path))
+        position = HEADER.size
+        columns = []
+        for typecode, length in (("q", rows), ("Q", 2 * rows + 1),
+                                 ("i", rows), ("b", rows)):
+            size = struct.calcsize(typecode) * length
+            columns.append(buffer[position:position + size].cast(typecode))
+            position += size
+        ids, offsets, categories, difficulties = columns
+        text = buffer[position:position + text_size]
+        return cls(ids, categories, difficulties, offsets, text, mapped=True,
+                   version=version)
+
+    def position(self, question_id):
+        position = bisect.bisect_left(self.ids, question_id)
+        if position < len(self.ids) and self.ids[position] == question_id:
+            return position
+        return None
+
+    def value(self, position, name):
+        if name == "id":
+            return self.ids[position]
+        if name == "question":
+            return str(self.text[self.offsets[2 * position]:
+                                 self.offsets[2 * position + 1]], "utf-8")
+        if name == "answer":
+            return str(self.text[self.offsets[2 * position + 1]:
+                                 self.offsets[2 * position + 2]], "utf-8")
+        if name == "category":
+            category = self.categories[position]
+            return None if category == NO_CATEGORY else category
+        difficulty = self.difficulties[position]
+        return None if difficulty == NO_DIFFICULTY else difficulty
+
+    def row(self, position, names):
+        return {name: self.value(position, name) for name in names}
+
+    def nbytes(self):
+        size = len(self.text)
+        for column in (self.ids, self.offsets, self.categories,
+                       self.difficulties, *self.by_category.values()):
+            size += len(column) * column.itemsize
+        return size
+
+
+class _IdsAt:
+    # The ids at some positions, as a sequence bisect can search.
+    __slots__ = ("ids", "positions")
+
+    def __init__(self, ids, positions):
+        self.ids = ids
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        return self.ids[self.positions[index]]
+
+
+# columns plus the writes since they were built: `added` maps ids to
+# FIELDS tuples (sorted in `added_ids`), `deleted` holds ids of columns.
+_State = namedtuple("_State", "columns added added_ids deleted")
+
+
+"""
+QuestionSnapshot
+    read model serving question listings, category pages and single
+    rows from Columns instead of the database, when QUESTION_SNAPSHOT is
+    on. Question.insert/delete are applied as a small delta on top of the
+    columns, which are rebuilt in memory after SNAPSHOT_COMPACT_AFTER
+    pending changes; bulk writes drop the snapshot until its next use.
+    With QUESTION_SNAPSHOT_PATH, load() maps that file when its row
+    count, largest id and change log version match the database (an
+    edit changes only the version), and otherwise builds the columns
+    from the database and saves them there. Writes that bypass the
+    models, e.g. plain SQL, are not in the change log: delete the file
+    after those.
+"""
+
+
+class QuestionSnapshot:
+
+    def __init__(self, app=None, path=QUESTION_SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("QUESTION_SNAPSHOT", QUESTION_SNAPSHOT)
+        on_question_change(app, self._apply)
+
+    @property
+    def enabled(self):
+        return current_app.config["QUESTION_SNAPSHOT"]
+
+    def load(self):
+        # The version is read first: a write committed before the rows
+        # are read leaves the file one version behind, so it is rebuilt
+        # next time rather than trusted.
+        version = QuestionChange.latest()
+        rows, max_id = db.session.query(
+            func.count(Question.id), func.max(Question.id)).one()
+        columns = self._open(rows, max_id or 0, version)
+        if columns is None:
+            columns = Columns.from_rows(
+                Question.query.with_entities(*QUESTION_COLUMNS)
+                .order_by(Question.id).yield_per(10000), version)
+            if self.path:
+                columns.save(self.path)
+        with self._lock:
+            self._state = _State(columns, {}, [], frozenset())
+
+    def _open(self, rows, max_id, version):
+        # The saved columns, if they match the database.
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            columns = Columns.open(self.path)
+        except ValueError:
+            # e.g. a file from before the version was stored
+            return None
+        if (len(columns), columns.max_id, columns.version) != \
+                (rows, max_id, version):
+            return None
+        return columns
+
+    def warm(self):
+        if self.enabled:
+            self.load()
+
+    def _current(self):
+        state = self._state
+        if state is None:
+            self.load()
+            state = self._state
+        return state
+
+    def _apply(self, event, question):
+        with self._lock:
+            state = self._state
+            if state is None:
+                return
+            if event == "reset":
+                self._state = None
+                return
+            added, added_ids = dict(state.added), list(state.added_ids)
+            deleted = set(state.deleted)
+            question_id = question["id"]
+            if event == "insert":
+                if question_id not in added:
+                    bisect.insort(added_ids, question_id)
+                added[question_id] = tuple(question[name] for name in FIELDS)
+                # Applied again by the change feed, or an update.
+                if state.columns.position(question_id) is not None:
+                    deleted.add(question_id)
+            elif event == "delete":
+                if added.pop(question_id, None) is not None:
+                    added_ids.remove(question_id)
+                if state.columns.position(question_id) is not None:
+                    deleted.add(question_id)
+            state = _State(state.columns, added, added_ids, frozenset(deleted))
+            if len(added) + len(deleted) > SNAPSHOT_COMPACT_AFTER:
+                state = _State(self._compact(state), {}, [], frozenset())
+            self._state = state
+
+    def _compact(self, state):
+        return Columns.from_rows(
+            self._row(state, question_id, position, FIELDS).values()
+            for question_id, position in self._iterate(state, None, None))
+
+    def _iterate(self, state, category, after):
+        # (id, position) in id order; position is None for added rows.
+        columns = state.columns
+        if category is None:
+            positions = range(len(columns))
+        else:
+            positions = columns.by_category.get(category, ())
+        start = 0
+        if after is not None:
+            start = bisect.bisect_right(_IdsAt(columns.ids, positions), after)
+
+        def base():
+            for index in range(start, len(positions)):
+                position = positions[index]
+                question_id = columns.ids[position]
+                if question_id not in state.deleted:
+                    yield question_id, position
+
+        def added():
+            first = 0 if after is None else bisect.bisect_right(
+                state.added_ids, after)
+            for question_id in state.added_ids[first:]:
+                if category is None or state.added[question_id][3] == category:
+                    yield question_id, None
+
+        if not state.added_ids:
+            return base()
+        return heapq.merge(base(), added(), key=lambda item: item[0])
+
+    def _row(self, state, question_id, position, names):
+        if position is None:
+            values = state.added[question_id]
+            return {name: values[FIELDS.index(name)] for name in names}
+        return state.columns.row(position, names)
+
+    def paginate(self, request, category=None):
+        # Same parameters and rows as pagination.paginate_questions.
+        state = self._current()
+        names = [column.key for column in question_columns(request)]
+        limit = page_size(request)
+        cursor = request.args.get("cursor", None)
+        after, offset = None, 0
+        if cursor:
+            after = decode_cursor(cursor)
+        else:
+            offset = page_offset(request)
+            if offset is None:
+                return []
+
+        if not state.added_ids and not state.deleted and after is None:
+            # No pending writes: the page is a slice of the columns.
+            columns = state.columns
+            if category is None:
+                positions = range(len(columns))
+            else:
+                positions = columns.by_category.get(category, ())
+            return [columns.row(positions[index], names) for index in
+                    range(offset, min(offset + limit, len(positions)))]
+
+        page = []
+        for index, (question_id, position) in enumerate(
+                self._iterate(state, category, after)):
+            if index >= offset + limit:
+                break
+            if index >= offset:
+                page.append(self._row(state, question_id, position, names))
+        return page
+
+    def get(self, question_id, columns=QUESTION_COLUMNS):
+        state = self._current()
+        names = [column.key for column in columns]
+        if question_id in state.added:
+            return self._row(state, question_id, None, names)
+        if question_id in state.deleted:
+            return None
+        position = state.columns.position(question_id)
+        if position is None:
+            return None
+        return state.columns.row(position, names)
+
+    def statistics(self):
+        state = self._current()
+        rows = len(state.columns)
+        size = state.columns.nbytes()
+        return {
+            "rows": rows,
+            "bytes": size,
+            "bytes_per_100k_questions": size * 100000 // rows if rows else 0,
+            "mapped": state.columns.mapped,
+            "pending_inserts": len(state.added),
+            "pending_deletes": len(state.deleted),
+        }
@@ -0,0 +1,41 @@
+from models import (db, on_question_change, Question, QuestionCount,
+                    ALL_QUESTIONS)
+
+
+"""
+QuestionTotals
+    O(1) question totals. Question totals are read from the
+    question_counts table kept up to date by Question.insert/delete; when
+    a counter row is missing they fall back to a SELECT COUNT(*) cached
+    in-process until the next question write.
+"""
+
+
+class QuestionTotals:
+
+    def __init__(self, app=None):
+        self._counts = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        on_question_change(app, self.invalidate)
+        with app.app_context():
+            if QuestionCount.query.get(ALL_QUESTIONS) is None:
+                QuestionCount.rebuild()
+
+    def invalidate(self, event=None, question=None):
+        self._counts.clear()
+
+    def questions(self, category=None):
+        key = ALL_QUESTIONS if category is None else category
+        counter = QuestionCount.query.get(key)
+        if counter is not None:
+            return counter.total
+
+        if key not in self._counts:
+            selection = db.session.query(db.func.count(Question.id))
+            if category is not None:
+                selection = selection.filter(Question.category == category)
+            self._counts[key] = selection.scalar()
+        return self._counts[key]
@@ -0,0 +1,142 @@
+"""
+Versioned schema migrations for the Trivia database.
+
+Each module in migrations/versions defines `revision`, `down_revision`
+(None for the first one) and upgrade(op)/downgrade(op) functions that
+issue SQL through `op`, branching on `op.dialect` where PostgreSQL and
+SQLite differ. The applied revision is kept in the schema_version table.
+Migrations are written to be safe on a database created by
+db.create_all(), so an existing database can simply be upgraded.
+
+    python -m migrations upgrade
+    python -m migrations downgrade 0001
+    python -m migrations upgrade --sql > upgrade.sql
+"""
+import importlib
+import os
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+VERSIONS = os.path.join(os.path.dirname(__file__), "versions")
+VERSION_TABLE = "schema_version"
+
+
+class MigrationError(Exception):
+    pass
+
+
+"""
+Operations
+    what a migration's upgrade(op)/downgrade(op) receives. Statements run
+    on `connection` online, or are written as SQL to `output` offline.
+"""
+
+
+class Operations:
+
+    def __init__(self, dialect, connection=None, output=None):
+        self.dialect = dialect
+        self.connection = connection
+        self.output = output
+
+    def execute(self, statement):
+        statement = statement.strip()
+        if self.connection is None:
+            self.output.write(statement + ";\n\n")
+        else:
+            self.connection.exec_driver_sql(statement)
+
+
+def load_revisions():
+    # Ordered from the first revision to head by following down_revision.
+    modules = {}
+    for name in sorted(os.listdir(VERSIONS)):
+        if name.endswith(".py") and not name.startswith("_"):
+            module = importlib.import_module(
+                "{}.versions.{}".format(__name__, name[:-3]))
+            modules[module.down_revision] = module
+
+    revisions = []
+    down_revision = None
+    while down_revision in modules:
+        module = modules.pop(down_revision)
+        revisions.append(module)
+        down_revision = module.revision
+    if modules:
+        raise MigrationError("revisions not reachable from the first one: {}"
+                             .format(sorted(m.revision for m in modules.values())))
+    return revisions
+
+
+def _index(revisions, revision):
+    # Position after `revision` in the chain: 0 for base, len for head.
+    if revision in (None, "base"):
+        return 0
+    if revision == "head":
+        return len(revisions)
+    for position, module in enumerate(revisions):
+        if module.revision == revision:
+            return position + 1
+    raise MigrationError("unknown revision {}".format(revision))
+
+
+def current(engine):
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, VERSION_TABLE):
+            return None
+        return connection.execute(
+            text("SELECT version_num FROM {}".format(VERSION_TABLE))).scalar()
+
+
+def _stamp(op, revision):
+    op.execute("CREATE TABLE IF NOT EXISTS {} "
+               "(version_num VARCHAR(32) PRIMARY KEY)".format(VERSION_TABLE))
+    op.execute("DELETE FROM {}".format(VERSION_TABLE))
+    if revision is not None:
+        op.execute("INSERT INTO {} (version_num) VALUES ('{}')".format(
+            VERSION_TABLE, revision))
+
+
+"""
+migrate(database, target, output=None, start=None)
+    upgrades or downgrades `database` to `target` ("head", "base" or a
+    revision), one transaction per revision. With `output` nothing is
+    executed: the SQL for going from `start` (default base) to `target`
+    is written there instead. Returns the revisions applied.
+"""
+
+
+def migrate(database, target="head", output=None, start=None):
+    revisions = load_revisions()
+    url = make_url(database)
+    dialect = url.get_backend_name()
+    engine = None
+    if output is None:
+        engine = create_engine(url)
+        start = current(engine)
+
+    position = _index(revisions, start)
+    goal = _index(revisions, target)
+    if goal >= position:
+        steps = [(module, "upgrade", module.revision)
+                 for module in revisions[position:goal]]
+    else:
+        steps = [(module, "downgrade", module.down_revision)
+                 for module in reversed(revisions[goal:position])]
+
+    for module, direction, revision in steps:
+        if engine is None:
+            op = Operations(dialect, output=output)
+            output.write("-- {} {}\n\n".format(direction, module.revision))
+            getattr(module, direction)(op)
+            _stamp(op, revision)
+            continue
+        with engine.begin() as connection:
+            op = Operations(dialect, connection=connection)
+            getattr(module, direction)(op)
+            _stamp(op, revision)
+
+    if engine is not None:
+        engine.dispose()
+    return [module.revision for module, _, _ in steps]
@@ -0,0 +1,61 @@
+import argparse
+import sys
+
+from sqlalchemy import create_engine
+
+from models import database_path
+from . import load_revisions, migrate, current, MigrationError
+from .check import check
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m migrations",
+        description="Upgrade, downgrade and inspect the database schema.")
+    parser.add_argument("--database", default=database_path,
+                        help="database URI (default: from DB_* variables)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    upgrade = commands.add_parser("upgrade", help="upgrade to a revision")
+    upgrade.add_argument("revision", nargs="?", default="head")
+    downgrade = commands.add_parser("downgrade", help="downgrade to a revision")
+    downgrade.add_argument("revision", help='revision to keep, or "base"')
+    for command in (upgrade, downgrade):
+        command.add_argument("--sql", action="store_true",
+                             help="print the SQL instead of running it")
+        command.add_argument("--from", dest="start",
+                             help="revision the --sql script starts from")
+    commands.add_parser("current", help="show the applied revision")
+    commands.add_parser("history", help="list revisions")
+    commands.add_parser("check", help="EXPLAIN endpoint queries for index use")
+    args = parser.parse_args()
+
+    try:
+        if args.command in ("upgrade", "downgrade"):
+            if args.sql:
+                migrate(args.database, args.revision, output=sys.stdout,
+                        start=args.start)
+            else:
+                for revision in migrate(args.database, args.revision):
+                    print("{} {}".format(args.command, revision))
+        elif args.command == "current":
+            print(current(create_engine(args.database)) or "base")
+        elif args.command == "history":
+            for module in load_revisions():
+                print("{} {}".format(module.revision,
+                                     module.__doc__.strip().split("\n")[0]))
+        elif args.command == "check":
+            failures = 0
+            for endpoint, description, plan, indexed in check(args.database):
+                failures += not indexed
+                print("{} {} ({})".format(
+                    "ok  " if indexed else "SCAN", endpoint, description))
+                for line in plan:
+                    print("       " + line)
+            sys.exit(1 if failures else 0)
+    except MigrationError as error:
+        parser.error(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Index checks: EXPLAIN each endpoint's hot queries and report whether the
+planner can answer them from an index rather than a full table scan.
+Sequential scans are disabled on PostgreSQL while explaining, so a small
+table doesn't hide a missing index.
+"""
+from sqlalchemy import create_engine, func, select
+
+from models import Question, QuestionChange, QuestionCount
+
+"""
+QUERIES
+    (endpoint, description, statement) for the queries each endpoint
+    issues per request, with literal sample parameters
+"""
+
+QUERIES = [
+    ("retrieve_questions", "cursor page",
+     select(Question.id, Question.question).where(Question.id > 10)
+     .order_by(Question.id).limit(10)),
+    ("retrieve_question_by_id", "single question",
+     select(Question).where(Question.id == 1)),
+    ("retrieve_question", "category page",
+     select(Question.id, Question.question).where(Question.category == 1)
+     .order_by(Question.id).limit(10)),
+    ("retrieve_question", "category cursor page",
+     select(Question.id, Question.question).where(
+         Question.category == 1, Question.id > 10)
+     .order_by(Question.id).limit(10)),
+    ("retrieve_question", "category total fallback",
+     select(func.count(Question.id)).where(Question.category == 1)),
+    ("retrieve_question", "category total",
+     select(QuestionCount.total).where(QuestionCount.category == 1)),
+    ("get_quiz", "quiz question",
+     select(Question.id, Question.question, Question.answer)
+     .where(Question.id == 1)),
+    ("get_quiz", "previous questions sent as text",
+     select(Question.id).where(Question.fingerprint.in_(["0" * 40]))),
+    ("post_question", "duplicate question",
+     select(Question.id).where(Question.fingerprint == "0" * 40)),
+    ("retrieve_changes", "changes since a version",
+     select(QuestionChange).where(QuestionChange.version > 10)
+     .order_by(QuestionChange.version).limit(100)),
+]
+
+
+def explain(connection, statement):
+    sql = str(statement.compile(
+        dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)
+        return [row[-1] for row in rows]
+    return [row[0] for row in connection.exec_driver_sql("EXPLAIN " + sql)]
+
+
+def uses_index(plan):
+    for line in plan:
+        # SQLite: "SCAN questions" without an index; PostgreSQL: "Seq Scan".
+        if line.startswith("SCAN ") and " USING " not in line:
+            return False
+        if "Seq Scan" in line:
+            return False
+    return True
+
+
+"""
+check(database)
+    returns (endpoint, description, plan, uses_index) for every query in
+    QUERIES against `database`
+"""
+
+
+def check(database):
+    engine = create_engine(database)
+    results = []
+    with engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.exec_driver_sql("SET enable_seqscan = off")
+        for endpoint, description, statement in QUERIES:
+            plan = explain(connection, statement)
+            results.append((endpoint, description, plan, uses_index(plan)))
+    engine.dispose()
+    return results
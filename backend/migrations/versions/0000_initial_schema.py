@@ -0,0 +1,34 @@
+"""
+categories and questions tables as created by trivia.psql, so upgrading
+an empty database (DB_CREATE_ALL=false) builds the whole schema. On a
+database created by trivia.psql or db.create_all() this does nothing.
+"""
+
+revision = "0000"
+down_revision = None
+
+
+def upgrade(op):
+    # SERIAL on PostgreSQL; an INTEGER PRIMARY KEY is the rowid on SQLite.
+    key = "SERIAL PRIMARY KEY" if op.dialect == "postgresql" \
+        else "INTEGER PRIMARY KEY"
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id {},
+            type TEXT
+        )
+    """.format(key))
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS questions (
+            id {},
+            question TEXT,
+            answer TEXT,
+            category INTEGER,
+            difficulty INTEGER
+        )
+    """.format(key))
+
+
+def downgrade(op):
+    op.execute("DROP TABLE IF EXISTS questions")
+    op.execute("DROP TABLE IF EXISTS categories")
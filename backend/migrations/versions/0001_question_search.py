@@ -0,0 +1,33 @@
+"""
+Full-text search columns for POST /questions (searchTerm) and
+GET /questions/search: generated tsvector columns with GIN indexes.
+PostgreSQL 12+ only; SQLite searches with the in-memory inverted index.
+"""
+
+revision = "0001"
+down_revision = "0000"
+
+
+def upgrade(op):
+    if op.dialect != "postgresql":
+        return
+    op.execute("""
+        ALTER TABLE questions
+            ADD COLUMN IF NOT EXISTS question_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('english', coalesce(question, ''))) STORED,
+            ADD COLUMN IF NOT EXISTS answer_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('english', coalesce(answer, ''))) STORED
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS questions_question_tsv_idx "
+               "ON questions USING gin (question_tsv)")
+    op.execute("CREATE INDEX IF NOT EXISTS questions_answer_tsv_idx "
+               "ON questions USING gin (answer_tsv)")
+
+
+def downgrade(op):
+    if op.dialect != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS questions_answer_tsv_idx")
+    op.execute("DROP INDEX IF EXISTS questions_question_tsv_idx")
+    op.execute("ALTER TABLE questions DROP COLUMN IF EXISTS answer_tsv, "
+               "DROP COLUMN IF EXISTS question_tsv")
@@ -0,0 +1,21 @@
+"""
+question_counts table holding the maintained question totals, one row
+per category plus category 0 for all questions. It is seeded on the
+next start (or with `flask rebuild-counts`).
+"""
+
+revision = "0002"
+down_revision = "0001"
+
+
+def upgrade(op):
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS question_counts (
+            category INTEGER NOT NULL PRIMARY KEY,
+            total INTEGER NOT NULL
+        )
+    """)
+
+
+def downgrade(op):
+    op.execute("DROP TABLE IF EXISTS question_counts")
@@ -0,0 +1,55 @@
+"""
+Composite (category, id) index serving /categories/<id>/questions pages
+and per-category quiz lookups in id order, and a foreign key from
+questions.category to categories. Questions pointing at a missing
+category get a NULL category first. SQLite can't add a constraint to an
+existing table, so the table is rebuilt there.
+"""
+
+revision = "0003"
+down_revision = "0002"
+
+QUESTIONS_SQLITE = """
+    CREATE TABLE {} (
+        id INTEGER NOT NULL PRIMARY KEY,
+        question VARCHAR,
+        answer VARCHAR,
+        category INTEGER{},
+        difficulty INTEGER
+    )
+"""
+FOREIGN_KEY = (" REFERENCES categories (id) "
+               "ON UPDATE CASCADE ON DELETE SET NULL")
+
+
+def _rebuild_sqlite(op, category):
+    op.execute(QUESTIONS_SQLITE.format("questions_rebuild", category))
+    op.execute("INSERT INTO questions_rebuild "
+               "SELECT id, question, answer, category, difficulty FROM questions")
+    op.execute("DROP TABLE questions")
+    op.execute("ALTER TABLE questions_rebuild RENAME TO questions")
+
+
+def upgrade(op):
+    op.execute("UPDATE questions SET category = NULL WHERE category NOT IN "
+               "(SELECT id FROM categories)")
+    if op.dialect == "sqlite":
+        _rebuild_sqlite(op, FOREIGN_KEY)
+    else:
+        # trivia.psql names the constraint "category"; keep a single one.
+        op.execute('ALTER TABLE questions DROP CONSTRAINT IF EXISTS "category"')
+        op.execute("ALTER TABLE questions "
+                   "DROP CONSTRAINT IF EXISTS questions_category_fkey")
+        op.execute("ALTER TABLE questions ADD CONSTRAINT questions_category_fkey "
+                   "FOREIGN KEY (category)" + FOREIGN_KEY)
+    op.execute("CREATE INDEX IF NOT EXISTS questions_category_id_idx "
+               "ON questions (category, id)")
+
+
+def downgrade(op):
+    op.execute("DROP INDEX IF EXISTS questions_category_id_idx")
+    if op.dialect == "sqlite":
+        _rebuild_sqlite(op, "")
+    else:
+        op.execute("ALTER TABLE questions "
+                   "DROP CONSTRAINT IF EXISTS questions_category_fkey")
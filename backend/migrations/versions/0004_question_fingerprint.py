@@ -0,0 +1,37 @@
+"""
+questions.fingerprint, the hash of the normalized question text, under
+a unique index so inserting a duplicate question fails on the index
+instead of needing a scan. Existing questions are fingerprinted in id
+order, and later duplicates of a question keep a NULL fingerprint.
+Offline (--sql) the column stays empty; fill it in with
+`flask fingerprint-questions` before serving.
+"""
+from sqlalchemy import inspect
+
+from models import backfill_fingerprints
+
+revision = "0004"
+down_revision = "0003"
+
+
+def _has_fingerprint(op):
+    # db.create_all() may have created the column already.
+    if op.connection is None:
+        return False
+    columns = inspect(op.connection).get_columns("questions")
+    return "fingerprint" in {column["name"] for column in columns}
+
+
+def upgrade(op):
+    if not _has_fingerprint(op):
+        op.execute("ALTER TABLE questions ADD COLUMN fingerprint VARCHAR(40)")
+    if op.connection is not None:
+        backfill_fingerprints(op.connection)
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS questions_fingerprint_key "
+               "ON questions (fingerprint)")
+
+
+def downgrade(op):
+    op.execute("DROP INDEX IF EXISTS questions_fingerprint_key")
+    # SQLite 3.35+ can drop a column that is no longer indexed.
+    op.execute("ALTER TABLE questions DROP COLUMN fingerprint")
@@ -0,0 +1,34 @@
+"""
+question_changes table, the log of question writes read by GET /changes
+and the change feed followers. Versions count up from 1; the log starts
+empty, so clients begin from the version GET /changes reports.
+"""
+
+revision = "0005"
+down_revision = "0004"
+
+
+def upgrade(op):
+    # SERIAL on PostgreSQL; an INTEGER PRIMARY KEY is the rowid on SQLite,
+    # which only grows as long as the latest row stays (prune-changes
+    # always keeps it).
+    if op.dialect == "postgresql":
+        version = "SERIAL PRIMARY KEY"
+    else:
+        version = "INTEGER PRIMARY KEY"
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS question_changes (
+            version {},
+            event VARCHAR(8) NOT NULL,
+            question_id INTEGER,
+            question VARCHAR,
+            answer VARCHAR,
+            category INTEGER,
+            difficulty INTEGER,
+            origin VARCHAR(64)
+        )
+    """.format(version))
+
+
+def downgrade(op):
+    op.execute("DROP TABLE IF EXISTS question_changes")
@@ -1,7 +1,16 @@
+import hashlib
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
-import json
+import re
+import socket
+import threading
+import time
+import unicodedata
+from sqlalchemy import (Column, String, Integer, ForeignKey, Index,
+                        create_engine, event, func, inspect, orm, text)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from dotenv import load_dotenv
 
 
@@ -13,20 +22,286 @@ DB_NAME = os.getenv('DB_NAME')
 database_path = 'postgresql://{}@{}/{}'.format(DB_USER, DB_HOST, DB_NAME)
 
 
-db = SQLAlchemy()
+DB_POOL_SIZE = os.getenv('DB_POOL_SIZE')
+DB_MAX_OVERFLOW = os.getenv('DB_MAX_OVERFLOW')
+DB_POOL_TIMEOUT = os.getenv('DB_POOL_TIMEOUT')
+DB_POOL_RECYCLE = os.getenv('DB_POOL_RECYCLE')
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_STATEMENT_TIMEOUT = os.getenv('DB_STATEMENT_TIMEOUT')
+DB_CREATE_ALL = os.getenv('DB_CREATE_ALL', 'true').lower() == 'true'
+DB_REPLICA_URIS = os.getenv('DB_REPLICA_URIS')
+DB_REPLICA_RETRY = int(os.getenv('DB_REPLICA_RETRY', 30))
+
+
+"""
+ReplicaSet
+    read replica engines handed out round-robin. A replica whose
+    connection fails (see the handle_error listener in setup_db) is
+    ejected for DB_REPLICA_RETRY seconds; with none healthy, choose()
+    returns None and reads go to the primary.
+"""
+
+
+class ReplicaSet:
+
+    def __init__(self, engines, retry=DB_REPLICA_RETRY, clock=time.monotonic):
+        self.engines = list(engines)
+        self.retry = retry
+        self.clock = clock
+        self._ejected = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.engines)
+
+    def healthy(self, engine):
+        return self._ejected.get(engine, 0) <= self.clock()
+
+    def choose(self):
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[self._next % len(self.engines)]
+                self._next += 1
+                if self.healthy(engine):
+                    return engine
+        return None
+
+    def eject(self, engine):
+        with self._lock:
+            self._ejected[engine] = self.clock() + self.retry
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+"""
+RoutingSession
+    sends the queries of a request marked read-only (g.db_read_only, set
+    by flaskr.routing) to one replica picked for the whole request, and
+    everything else (writes, flushes, CLI commands, startup loads) to
+    the primary engine.
+"""
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self._flushing and has_app_context() and g.get("db_read_only"):
+            replica = self._replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+    def _replica(self):
+        if "db_replica" not in g:
+            replicas = self.app.extensions.get("db_replicas")
+            g.db_replica = replicas.choose() if replicas else None
+        return g.db_replica
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+"""
+engine_options(database)
+    SQLAlchemy engine options read from the DB_POOL_* environment
+    variables. Queue pool sizing is left out for SQLite, and
+    DB_STATEMENT_TIMEOUT (milliseconds) only applies to PostgreSQL.
+"""
+
+
+def engine_options(database):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    backend = make_url(database).get_backend_name()
+
+    if backend != "sqlite":
+        pool = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+        options.update(
+            {key: int(value) for key, value in pool.items() if value})
+
+    if backend == "postgresql" and DB_STATEMENT_TIMEOUT:
+        options["connect_args"] = {
+            "options": "-c statement_timeout={}".format(int(DB_STATEMENT_TIMEOUT))
+        }
+
+    return options
+
 
 """
-setup_db(app)
-    binds a flask application and a SQLAlchemy service
+setup_db(app, database=None, pool=None, create_all=None)
+    binds a flask application and a SQLAlchemy service, to `database`,
+    else the app's SQLALCHEMY_DATABASE_URI (e.g. from the test_config of
+    create_app), else the DB_* environment variables. `pool` overrides
+    engine options (pool_size, max_overflow, pool_timeout, pool_recycle,
+    pool_pre_ping, ...) on top of engine_options() and the app's
+    SQLALCHEMY_ENGINE_OPTIONS; create_all=False (or DB_CREATE_ALL=false)
+    skips db.create_all() when the schema is managed separately.
+    `replicas` lists read replica URIs (default: DB_REPLICA_URIS) used
+    by RoutingSession.
 """
 
 
-def setup_db(app, database=database_path):
+def setup_db(app, database=None, pool=None, create_all=None,
+             replicas=None):
+    if database is None:
+        database = app.config.get("SQLALCHEMY_DATABASE_URI") or database_path
     app.config["SQLALCHEMY_DATABASE_URI"] = database
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    options = engine_options(database)
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    options.update(pool or {})
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
     db.app = app
     db.init_app(app)
-    db.create_all()
+    setup_replicas(app, replicas, pool)
+    if create_all is None:
+        create_all = DB_CREATE_ALL
+    if create_all:
+        db.create_all()
+
+
+"""
+setup_replicas(app, replicas=None, pool=None)
+    creates an engine per read replica URI (`replicas`, else the comma
+    separated DB_REPLICA_URIS) with the same engine options as the
+    primary, and ejects a replica from the rotation when its connection
+    fails
+"""
+
+
+def setup_replicas(app, replicas=None, pool=None):
+    if replicas is None:
+        replicas = [uri.strip() for uri in (DB_REPLICA_URIS or "").split(",")
+                    if uri.strip()]
+    previous = app.extensions.pop("db_replicas", None)
+    if previous is not None:
+        previous.dispose()
+    if not replicas:
+        return
+
+    engines = []
+    for uri in replicas:
+        options = engine_options(uri)
+        options.update(pool or {})
+        engines.append(create_engine(uri, **options))
+    replica_set = ReplicaSet(engines)
+
+    def handle_error(context):
+        if context.is_disconnect or context.connection is None:
+            replica_set.eject(context.engine)
+
+    for engine in engines:
+        event.listen(engine, "handle_error", handle_error)
+    app.extensions["db_replicas"] = replica_set
+
+
+def _pool_statistics(pool):
+    statistics = {"class": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            statistics[name] = getattr(pool, name)()
+    return statistics
+
+
+def pool_statistics():
+    statistics = _pool_statistics(db.engine.pool)
+    replicas = current_app.extensions.get("db_replicas")
+    if replicas:
+        statistics["replicas"] = [
+            dict(_pool_statistics(engine.pool),
+                 url=engine.url.render_as_string(hide_password=True),
+                 healthy=replicas.healthy(engine))
+            for engine in replicas.engines
+        ]
+    return statistics
+
+
+"""
+on_question_change(app, listener)
+    registers listener(event, question) to be called after a committed
+    Question write, with event "insert" or "delete" and the question
+    formatted as a dict, or event "reset" and None after bulk writes.
+    An update is sent as a "delete" of the previous values followed by
+    an "insert" of the new ones.
+"""
+
+
+def on_question_change(app, listener):
+    app.extensions.setdefault("question_listeners", []).append(listener)
+
+
+def notify_question_change(event, question):
+    for listener in current_app.extensions.get("question_listeners", ()):
+        listener(event, question)
+
+
+def on_category_change(app, listener):
+    app.extensions.setdefault("category_listeners", []).append(listener)
+
+
+def notify_category_change(event, category):
+    for listener in current_app.extensions.get("category_listeners", ()):
+        listener(event, category)
+
+
+"""
+question_fingerprint(question)
+    SHA-1 of the question text folded for comparison: NFKC-normalized,
+    case-folded, with punctuation and symbols dropped and whitespace
+    collapsed, so "What is H2O?" and "what  is h2o" get the same
+    fingerprint
+"""
+
+_NOT_WORDS = re.compile(r"[\W_]+")
+
+
+def normalize_question(question):
+    folded = unicodedata.normalize("NFKC", question or "").casefold()
+    return _NOT_WORDS.sub(" ", folded).strip()
+
+
+def question_fingerprint(question):
+    return hashlib.sha1(normalize_question(question).encode()).hexdigest()
+
+
+def backfill_fingerprints(connection):
+    # Fingerprints rows without one, in id order; a row duplicating an
+    # earlier one keeps a NULL fingerprint. Returns the rows updated.
+    taken = {fingerprint for fingerprint, in connection.exec_driver_sql(
+        "SELECT fingerprint FROM questions WHERE fingerprint IS NOT NULL")}
+    updates = []
+    for question_id, question in connection.exec_driver_sql(
+            "SELECT id, question FROM questions WHERE fingerprint IS NULL "
+            "ORDER BY id").fetchall():
+        fingerprint = question_fingerprint(question)
+        if fingerprint not in taken:
+            taken.add(fingerprint)
+            updates.append({"id": question_id, "fingerprint": fingerprint})
+    if updates:
+        connection.execute(text(
+            "UPDATE questions SET fingerprint = :fingerprint WHERE id = :id"),
+            updates)
+    return len(updates)
+
+
+class DuplicateQuestion(Exception):
+    """A question with the same fingerprint exists already."""
+
+    def __init__(self, question_id):
+        super().__init__("duplicate of question {}".format(question_id))
+        self.question_id = question_id
 
 
 """
@@ -37,29 +312,106 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    # Schema changes go through a migration in migrations/versions too.
+    __table_args__ = (
+        Index('questions_category_id_idx', 'category', 'id'),
+        Index('questions_fingerprint_key', 'fingerprint', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(Integer)
+    category = Column(Integer, ForeignKey(
+        'categories.id', name='questions_category_fkey',
+        onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
+    # question_fingerprint(question), unique: duplicates are rejected by
+    # the index instead of a scan. NULL for duplicates that predate it.
+    fingerprint = Column(String(40))
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
         self.category = category
         self.difficulty = difficulty
+        self.fingerprint = question_fingerprint(question)
+
+    @classmethod
+    def with_fingerprint(cls, fingerprint):
+        return cls.query.with_entities(cls.id).filter(
+            cls.fingerprint == fingerprint).scalar()
+
+    @classmethod
+    def existing_fingerprints(cls, fingerprints):
+        rows = cls.query.with_entities(cls.fingerprint).filter(
+            cls.fingerprint.in_(fingerprints))
+        return {fingerprint for fingerprint, in rows}
+
+    def _write(self, write):
+        # Runs write() and, when the fingerprint index rejects it, raises
+        # DuplicateQuestion with the id of the question already there.
+        fingerprint = self.fingerprint
+        try:
+            write()
+        except IntegrityError:
+            db.session.rollback()
+            existing = Question.with_fingerprint(fingerprint)
+            if existing is None:
+                raise
+            raise DuplicateQuestion(existing)
 
     def insert(self):
         db.session.add(self)
+        self._write(db.session.flush)
+        QuestionCount.bump(self.category, 1)
+        question = self.format()
+        QuestionChange.record("insert", question)
         db.session.commit()
+        notify_question_change("insert", question)
+        return question
 
     def update(self):
+        state = inspect(self)
+        previous = self.format()
+        for key in previous:
+            deleted = state.attrs[key].history.deleted
+            if deleted:
+                previous[key] = deleted[0]
+        question = self.format()
+        self.fingerprint = question_fingerprint(self.question)
+        self._write(db.session.flush)
+        if previous["category"] != question["category"]:
+            QuestionCount.bump(previous["category"], -1)
+            QuestionCount.bump(question["category"], 1)
+        QuestionChange.record("delete", previous)
+        QuestionChange.record("insert", question)
         db.session.commit()
+        notify_question_change("delete", previous)
+        notify_question_change("insert", question)
+
+    @classmethod
+    def insert_many(cls, questions):
+        # Batched executemany within the caller's transaction; the caller
+        # records a "reset" change, commits and then sends the "reset"
+        # notification.
+        for question in questions:
+            question.setdefault(
+                "fingerprint", question_fingerprint(question["question"]))
+        db.session.execute(cls.__table__.insert(), questions)
+        per_category = {}
+        for question in questions:
+            category = question.get("category")
+            per_category[category] = per_category.get(category, 0) + 1
+        for category, total in per_category.items():
+            QuestionCount.bump(category, total)
 
     def delete(self):
+        question = self.format()
         db.session.delete(self)
+        QuestionCount.bump(self.category, -1)
+        QuestionChange.record("delete", question)
         db.session.commit()
+        notify_question_change("delete", question)
 
     def format(self):
         return {
@@ -71,6 +423,107 @@ class Question(db.Model):
         }
 
 
+"""
+QuestionChange
+    append-only log of Question writes, numbered by a version that only
+    grows: "insert" and "delete" carry the question's values, "reset"
+    (bulk writes, pruned history) means reload everything. A change is
+    added in the transaction of its write, so it becomes visible exactly
+    when the write does. On PostgreSQL, writers take an advisory lock
+    until commit, so versions also become visible in order, and a
+    NOTIFY on CHANGES_CHANNEL wakes the followers.
+"""
+
+CHANGES_CHANNEL = 'question_changes'
+# pg_advisory_xact_lock key shared by every writer of the change log.
+CHANGES_LOCK_KEY = 0x7175657374
+
+
+def change_origin():
+    # The writing process, whose own caches are current already.
+    return "{}:{}".format(socket.gethostname(), os.getpid())[:64]
+
+
+class QuestionChange(db.Model):
+    __tablename__ = 'question_changes'
+
+    version = Column(Integer, primary_key=True)
+    event = Column(String(8), nullable=False)
+    question_id = Column(Integer)
+    question = Column(String)
+    answer = Column(String)
+    category = Column(Integer)
+    difficulty = Column(Integer)
+    origin = Column(String(64))
+
+    def __init__(self, event, question=None):
+        question = question or {}
+        self.event = event
+        self.question_id = question.get('id')
+        self.question = question.get('question')
+        self.answer = question.get('answer')
+        self.category = question.get('category')
+        self.difficulty = question.get('difficulty')
+        self.origin = change_origin()
+
+    @classmethod
+    def record(cls, event, question=None):
+        # Runs inside the caller's transaction.
+        postgres = db.engine.dialect.name == "postgresql"
+        if postgres:
+            db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                               {"key": CHANGES_LOCK_KEY})
+        change = cls(event, question)
+        db.session.add(change)
+        if postgres:
+            db.session.flush()
+            db.session.execute(text("SELECT pg_notify(:channel, :version)"),
+                               {"channel": CHANGES_CHANNEL,
+                                "version": str(change.version)})
+
+    @classmethod
+    def since(cls, version, limit):
+        return cls.query.filter(cls.version > version).order_by(
+            cls.version).limit(limit).all()
+
+    @classmethod
+    def latest(cls):
+        return db.session.query(func.max(cls.version)).scalar() or 0
+
+    @classmethod
+    def prune(cls, keep):
+        # Deletes all but the last `keep` changes. The oldest one kept
+        # becomes a "reset", so readers from before it reload everything.
+        cutoff = db.session.query(cls.version).order_by(
+            cls.version.desc()).offset(keep - 1).limit(1).scalar()
+        if cutoff is None:
+            return 0
+        pruned = cls.query.filter(cls.version < cutoff).delete(
+            synchronize_session=False)
+        cls.query.filter(cls.version == cutoff).update({
+            cls.event: "reset", cls.question_id: None, cls.question: None,
+            cls.answer: None, cls.category: None, cls.difficulty: None,
+        }, synchronize_session=False)
+        db.session.commit()
+        return pruned
+
+    def format(self):
+        question = None
+        if self.event != "reset":
+            question = {
+                'id': self.question_id,
+                'question': self.question,
+                'answer': self.answer,
+                'category': self.category,
+                'difficulty': self.difficulty
+            }
+        return {
+            'version': self.version,
+            'event': self.event,
+            'question': question
+        }
+
+
 """
 Category
 
@@ -86,8 +539,72 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+        notify_category_change("insert", self.format())
+
+    def update(self):
+        db.session.commit()
+        notify_category_change("update", self.format())
+
+    def delete(self):
+        category = self.format()
+        db.session.delete(self)
+        db.session.commit()
+        notify_category_change("delete", category)
+
     def format(self):
         return {
             'id': self.id,
             'type': self.type
         }
+
+
+"""
+QuestionCount
+    maintained question totals, one row per category plus the
+    ALL_QUESTIONS row for the global total
+"""
+
+ALL_QUESTIONS = 0
+
+
+class QuestionCount(db.Model):
+    __tablename__ = 'question_counts'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    total = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, category, total=0):
+        self.category = category
+        self.total = total
+
+    @classmethod
+    def bump(cls, category, delta):
+        # Runs inside the caller's transaction. Nothing is written until
+        # the counters have been seeded by rebuild().
+        if cls.query.get(ALL_QUESTIONS) is None:
+            return
+        keys = [ALL_QUESTIONS]
+        if category is not None:
+            keys.append(int(category))
+        for key in keys:
+            updated = cls.query.filter(cls.category == key).update(
+                {cls.total: cls.total + delta}, synchronize_session=False)
+            if not updated:
+                db.session.add(cls(key, max(delta, 0)))
+
+    @classmethod
+    def rebuild(cls):
+        cls.query.delete()
+        db.session.add(cls(ALL_QUESTIONS, Question.query.count()))
+        counts = db.session.query(Question.category, func.count(Question.id)).filter(
+            Question.category.isnot(None)).group_by(Question.category)
+        for category, total in counts:
+            db.session.add(cls(category, total))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # another worker seeded the counters first
+            db.session.rollback()
@@ -0,0 +1,192 @@
+"""
+Production entry point for the Trivia API.
+
+    python serve.py --bind 0.0.0.0:5000 --workers 4
+
+Builds the app once in the master process, warms its in-memory caches
+(categories, quiz question ids, the search index, the question snapshot),
+closes database connections and freezes the garbage collector, then forks
+the workers, which share the warm caches copy-on-write and keep them
+current with each other's writes through the change feed. Runs under
+gunicorn when it is installed, or else forks werkzeug servers on one
+inherited socket.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+STARTED = time.perf_counter()
+
+from flaskr import create_app, warm_caches  # noqa: E402
+from models import db  # noqa: E402
+
+SERVE_BIND = os.getenv('SERVE_BIND', '127.0.0.1:5000')
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+# Threads per gunicorn worker; each open /changes/stream holds one, so
+# streams are capped at half of them.
+SERVE_THREADS = int(os.getenv('SERVE_THREADS', 16))
+
+logger = logging.getLogger("trivia.serve")
+
+
+def elapsed_ms():
+    return (time.perf_counter() - STARTED) * 1000
+
+
+"""
+load_app()
+    creates and warms the app, then leaves it ready to fork: no open
+    database connections and every object built so far moved out of
+    the collector's reach, so workers don't copy those pages by
+    touching reference counts during collections
+"""
+
+
+def load_app():
+    app = create_app()
+    warm_caches(app)
+    logger.info("app loaded and caches warmed in %.0f ms", elapsed_ms())
+    release_connections(app)
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def release_connections(app):
+    # Connections must not be shared with the forked workers.
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        replicas = app.extensions.get("db_replicas")
+        if replicas:
+            replicas.dispose()
+
+
+def worker_ready(app, pid):
+    # Each worker follows the change feed, applying the writes of the
+    # other workers to its own copy of the caches.
+    app.extensions["change_feed"].follow()
+    logger.info("worker %s ready %.0f ms after start", pid, elapsed_ms())
+
+
+def serve_gunicorn(app, bind, workers, timeout, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("timeout", timeout)
+            # Threaded workers, so a Server-Sent Events stream (up to
+            # CHANGES_STREAM_SECONDS) holds one thread, not the worker,
+            # and the worker keeps answering the arbiter's heartbeat.
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", threads)
+            self.cfg.set("preload_app", True)
+            self.cfg.set("post_fork",
+                         lambda server, worker: release_connections(app))
+            self.cfg.set("post_worker_init",
+                         lambda worker: worker_ready(app, worker.pid))
+
+        def load(self):
+            return app
+
+    app.config["CHANGES_MAX_STREAMS"] = min(
+        app.config["CHANGES_MAX_STREAMS"], max(1, threads // 2))
+    Server().run()
+
+
+"""
+serve_forked(app, bind, workers)
+    fallback pre-fork server: the master listens once, forks `workers`
+    processes that each serve the shared socket with a threaded werkzeug
+    server, restarts workers that exit and stops them all on SIGTERM or
+    SIGINT
+"""
+
+
+def serve_forked(app, bind, workers):
+    from werkzeug.serving import make_server
+
+    host, port = bind.rsplit(":", 1)
+    listener = socket.create_server((host, int(port)), reuse_port=False)
+    listener.set_inheritable(True)
+    logger.info("listening on http://%s with %d workers", bind, workers)
+
+    def spawn():
+        pid = os.fork()
+        if pid:
+            return pid
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        server = make_server(host, int(port), app, threaded=True,
+                             fd=listener.fileno())
+        worker_ready(app, os.getpid())
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+
+    children = {spawn() for _ in range(workers)}
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning("worker %s exited, restarting", pid)
+            children.add(spawn())
+    listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--bind", default=SERVE_BIND,
+                        help="host:port to listen on (default: SERVE_BIND)")
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY,
+                        help="worker processes (default: WEB_CONCURRENCY)")
+    parser.add_argument("--timeout", type=int, default=30,
+                        help="gunicorn worker timeout in seconds")
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS,
+                        help="threads per gunicorn worker "
+                             "(default: SERVE_THREADS)")
+    parser.add_argument("--no-gunicorn", action="store_true",
+                        help="use the built-in fork server")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(process)d %(message)s")
+
+    app = load_app()
+    try:
+        if args.no_gunicorn:
+            raise ImportError
+        import gunicorn  # noqa: F401
+    except ImportError:
+        serve_forked(app, args.bind, args.workers)
+    else:
+        serve_gunicorn(app, args.bind, args.workers, args.timeout,
+                       args.threads)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,29 @@
+import asyncio
+import decimal
 import os
+import re
+import tempfile
+import time
 import unittest
+from unittest import mock
 import json
-from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, inspect
 
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, warm_caches
+from flaskr.asgi import create_async_app
+from flaskr.sessions import RedisSessionStore, create_session_store
+from flaskr.ratelimit import create_bucket_store
+from flaskr.instrumentation import QueryBudgetExceeded
+from flaskr.snapshot import QuestionSnapshot
+from flaskr.quiz import IdPermutation
+from flaskr.serialization import (OrjsonProvider, StdlibJSONProvider, jsonify,
+                                  orjson)
+from migrations import current, load_revisions, migrate
+from models import (db, notify_question_change, notify_category_change,
+                    backfill_fingerprints, Question, QuestionChange, Category,
+                    QuestionCount, ReplicaSet, setup_replicas)
 
 load_dotenv()
 
@@ -14,31 +31,204 @@ DB_USER_TEST = os.getenv('DB_USER_TEST')
 DB_NAME_TEST = os.getenv('DB_NAME_TEST')
 DB_HOST_TEST = os.getenv('DB_URL_TEST')
 
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'trivia.psql')
+COPY_BLOCK = re.compile(
+    r'^COPY public\.(\w+) \(([^)]*)\) FROM stdin;\n(.*?)\n\\\.$',
+    re.MULTILINE | re.DOTALL)
+
+# The test database from DB_*_TEST when set, else an in-memory SQLite
+# database, in which the driver is left in autocommit so that the BEGIN
+# and SAVEPOINT statements SQLAlchemy sends are the only ones.
+TEST_CONFIG = {"TESTING": True}
+if DB_NAME_TEST:
+    TEST_CONFIG.update({
+        "SQLALCHEMY_DATABASE_URI": 'postgresql://{}@{}/{}'.format(
+            DB_USER_TEST, DB_HOST_TEST, DB_NAME_TEST),
+    })
+else:
+    TEST_CONFIG.update({
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+        "SQLALCHEMY_ENGINE_OPTIONS": {
+            "connect_args": {"isolation_level": None,
+                             "check_same_thread": False},
+        },
+    })
+
+
+def load_fixtures(path=FIXTURES):
+    """Rows of each COPY block of a pg_dump file, by table."""
+    with open(path) as dump:
+        text = dump.read()
+    tables = {}
+    for table, columns, rows in COPY_BLOCK.findall(text):
+        names = [name.strip() for name in columns.split(",")]
+        tables[table] = [
+            dict(zip(names, (None if value == "\\N" else value
+                             for value in row.split("\t"))))
+            for row in rows.split("\n")
+        ]
+    return tables
+
+
+def seed_fixtures():
+    """Bulk loads trivia.psql into an empty test database."""
+    if Question.query.first() is not None:
+        return
+    tables = load_fixtures()
+    for model in (Category, Question):
+        db.session.execute(model.__table__.insert(),
+                           tables[model.__tablename__])
+    if db.engine.dialect.name == "postgresql":
+        for model in (Category, Question):
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                "(SELECT max(id) FROM {}))".format(model.__tablename__)),
+                {"table": model.__tablename__})
+    backfill_fingerprints(db.session.connection())
+    db.session.commit()
+    QuestionCount.rebuild()
+
+
+def seed_database(url):
+    """Creates the schema and the fixtures in the database at `url`."""
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    tables = load_fixtures()
+    with engine.begin() as connection:
+        for model in (Category, Question):
+            connection.execute(model.__table__.insert(),
+                               tables[model.__tablename__])
+        backfill_fingerprints(connection)
+    engine.dispose()
+
+
+async def asgi_request(app, method, path, body=None):
+    """Sends one request to an ASGI app; returns (status, JSON body)."""
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "method": method, "path": path,
+             "query_string": query.encode()}
+    request = {"type": "http.request",
+               "body": b"" if body is None else json.dumps(body).encode()}
+    messages = []
+
+    async def receive():
+        return request
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"], json.loads(messages[1]["body"])
+
+
+async def asgi_lifespan(app, scenario):
+    """Awaits scenario() between an ASGI app's startup and shutdown."""
+    messages = asyncio.Queue()
+    sent = asyncio.Queue()
+    lifespan = asyncio.create_task(
+        app({"type": "lifespan"}, messages.get, sent.put))
+    await messages.put({"type": "lifespan.startup"})
+    assert (await sent.get())["type"] == "lifespan.startup.complete"
+    try:
+        return await scenario()
+    finally:
+        await messages.put({"type": "lifespan.shutdown"})
+        await sent.get()
+        await lifespan
+
+
+class HTMLText:
+    """An object with only __html__, like a template snippet."""
+
+    def __init__(self, html):
+        self.html = html
+
+    def __html__(self):
+        return self.html
+
+
+class FakeRedis:
+    """The handful of Redis commands RedisSessionStore uses, in memory."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.data.setdefault(key, {})
+        for name, item in dict(mapping or {}, **(
+                {field: value} if field is not None else {})).items():
+            fields[name.encode()] = str(item).encode()
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(str(v).encode() for v in values)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create the app, its schema and the fixtures once."""
+        cls.app = create_app(TEST_CONFIG)
+        with cls.app.app_context():
+            if db.engine.dialect.name == "sqlite":
+                event.listen(db.engine, "begin",
+                             lambda connection: connection.exec_driver_sql("BEGIN"))
+            seed_fixtures()
+        cls.config = dict(cls.app.config)
+        cls.reset_app()
+
+    @classmethod
+    def reset_app(cls):
+        """Restore the app config and reload every in-memory cache."""
+        cls.app.config.clear()
+        cls.app.config.update(cls.config)
+        cls.app.extensions["quiz_sessions"] = create_session_store()
+        cls.app.extensions["rate_limiter"].store = create_bucket_store()
+        with cls.app.app_context():
+            notify_question_change("reset", None)
+            notify_category_change("reset", None)
+        warm_caches(cls.app)
+
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Run the test in a transaction rolled back by tearDown."""
         self.client = self.app.test_client
-        self.database_name = DB_NAME_TEST
-        self.username = DB_USER_TEST
-        self.url = DB_HOST_TEST
-        self.database_path = 'postgresql://{}@{}/{}'.format(
-            self.username, self.url, self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.session = db.session
+        db.session = db.create_scoped_session(
+            {"bind": self.connection, "binds": {}})
+        self.savepoint = self.connection.begin_nested()
+
+        # commits and rollbacks in the app end the savepoint; start another
+        @event.listens_for(db.session, "after_transaction_end")
+        def restart_savepoint(session, transaction):
+            if not self.savepoint.is_active:
+                self.savepoint = self.connection.begin_nested()
 
     def tearDown(self):
-        """Executed after reach test"""
-        pass
+        """Roll back the test's writes and reset the app."""
+        db.session.remove()
+        self.transaction.rollback()
+        self.connection.close()
+        db.session = self.session
+        self.context.pop()
+        self.reset_app()
 
     """
     Write at least one test for each test for successful operation and for expected errors.
@@ -62,6 +252,95 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["error"], 404)
         self.assertTrue(data["message"])
 
+    def test_get_questions_with_cursor_success(self):
+        res = self.client().get("/questions")
+        first_page = json.loads(res.data)
+
+        res = self.client().get(
+            "/questions?cursor={}".format(first_page["next_cursor"]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertGreater(data["questions"][0]["id"],
+                           first_page["questions"][-1]["id"])
+
+    def test_get_questions_with_cursor_failure(self):
+        res = self.client().get("/questions?cursor=not-a-cursor")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 400)
+
+    def test_get_questions_per_page_and_fields_success(self):
+        res = self.client().get("/questions?per_page=3&fields=question")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["questions"]), 3)
+        self.assertEqual(set(data["questions"][0]), {"id", "question"})
+        self.assertTrue(data["next_cursor"])
+
+    def test_get_questions_per_page_and_fields_failure(self):
+        res = self.client().get("/questions?fields=question,secret")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 400)
+
+    def test_get_question_by_id_success(self):
+        res = self.client().get("/questions/13")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["question"]["category"], "Geography")
+
+    def test_get_question_by_id_failure(self):
+        res = self.client().get("/questions/1000")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 404)
+
+    def test_get_questions_not_modified(self):
+        res = self.client().get("/questions")
+        etag = res.headers["ETag"]
+
+        res = self.client().get(
+            "/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers["ETag"], etag)
+        self.assertEqual(res.data, b"")
+
+    def test_get_questions_etag_changes_after_write(self):
+        etag = self.client().get("/questions").headers["ETag"]
+        with self.app.app_context():
+            question = Question("Is this cached?", "No", 1, 1)
+            question.insert()
+            question.delete()
+
+        res = self.client().get(
+            "/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers["ETag"], etag)
+
+    def test_get_questions_etag_differs_per_worker(self):
+        etag = self.client().get("/questions").headers["ETag"]
+        # a worker forked from this process
+        with mock.patch("flaskr.caching.os.getpid", return_value=-1):
+            res = self.client().get(
+                "/questions", headers={"If-None-Match": etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers["ETag"], etag)
+
     def test_get_categories_success(self):
         res = self.client().get("/categories")
         data = json.loads(res.data)
@@ -100,6 +379,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 422)
         self.assertEqual(data["message"], "unprocessable")
 
+    def test_search_questions_success(self):
+        res = self.client().get("/questions/search?q=Africa")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["current_category"], 'Geography')
+        self.assertEqual(data["total_questions"], 1)
+        self.assertEqual(len(data["questions"]), 1)
+
+    def test_search_questions_in_answers_success(self):
+        res = self.client().get("/questions/search?q=Scarab&answers=true")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["questions"][0]["answer"], "Scarab")
+
+    def test_search_questions_failure(self):
+        res = self.client().get("/questions/search?q=Scarab")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 404)
+
     def test_get_question_based_on_category_success(self):
         res = self.client().get("/categories/1/questions")
         data = json.loads(res.data)
@@ -110,6 +415,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["total_questions"])
         self.assertTrue(data["questions"])
 
+    def test_get_question_based_on_category_total(self):
+        res = self.client().get("/categories/1/questions")
+        data = json.loads(res.data)
+        all_questions = json.loads(self.client().get("/questions").data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertGreaterEqual(data["total_questions"], len(data["questions"]))
+        self.assertLess(data["total_questions"],
+                        all_questions["total_questions"])
+
     def test_get_question_based_on_category_failure(self):
         res = self.client().get("/categories/100/questions")
         data = json.loads(res.data)
@@ -123,19 +439,19 @@ class TriviaTestCase(unittest.TestCase):
     uncomment to test CREATE
     """
 
-    # def test_create_new_question_success(self):
-    #     res = self.client().post("/questions", json={
-    #         "question": "Is this a test question",
-    #         "answer": "Test answer",
-    #         "category": 5,
-    #         "difficulty": 5
-    #     })
-    #     data = json.loads(res.data)
+    def test_create_new_question_success(self):
+        res = self.client().post("/questions", json={
+            "question": "Is this a test question",
+            "answer": "Test answer",
+            "category": 5,
+            "difficulty": 5
+        })
+        data = json.loads(res.data)
 
-    #     self.assertEqual(res.status_code, 200)
-    #     self.assertTrue(data["created"])
-    #     self.assertTrue(data["total_questions"])
-    #     self.assertTrue(len(data['questions']))
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data["created"])
+        self.assertTrue(data["total_questions"])
+        self.assertNotIn("questions", data)
 
     def test_create_new_question_failure(self):
         res = self.client().post("/questions", json={
@@ -151,17 +467,158 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 422)
         self.assertEqual(data["message"], "unprocessable")
 
+    def test_bulk_import_questions_success(self):
+        rows = [
+            {"question": "Bulk question one?", "answer": "One",
+             "category": 1, "difficulty": 1},
+            {"question": "Bulk question two?", "answer": "Two",
+             "category": 2, "difficulty": 2},
+        ]
+        res = self.client().post(
+            "/questions/bulk",
+            data="\n".join(json.dumps(row) for row in rows),
+            content_type="application/x-ndjson")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["inserted"], 2)
+        self.assertEqual(data["errors"], [])
+
+    def test_create_duplicate_question_failure(self):
+        res = self.client().post("/questions", json={
+            "question": "what is the heaviest organ in the human body",
+            "answer": "Skin",
+            "category": 1,
+            "difficulty": 4
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 409)
+        self.assertEqual(data["duplicate_of"], 20)
+
+    def test_bulk_import_duplicate_questions_failure(self):
+        rows = [
+            {"question": "Bulk question one?", "answer": "One",
+             "category": 1, "difficulty": 1},
+            {"question": "BULK QUESTION ONE", "answer": "One",
+             "category": 1, "difficulty": 1},
+            {"question": "Who discovered penicillin?", "answer": "Fleming",
+             "category": 1, "difficulty": 3},
+        ]
+        res = self.client().post(
+            "/questions/bulk",
+            data="\n".join(json.dumps(row) for row in rows),
+            content_type="application/x-ndjson")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(sorted(error["line"] for error in data["errors"]),
+                         [2, 3])
+
+    def test_bulk_import_questions_failure(self):
+        res = self.client().post(
+            "/questions/bulk",
+            data="question,answer,category,difficulty\n,,1,1\n",
+            content_type="text/csv")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 422)
+
+    def test_bulk_import_invalid_text_failure(self):
+        res = self.client().post(
+            "/questions/bulk",
+            data=b'{"question": 5, "answer": "a", "category": 1, '
+                 b'"difficulty": 1}\n'
+                 b'\xff\xfe\n'
+                 b'{"question": "Bulk question one?", "answer": "One", '
+                 b'"category": 1, "difficulty": 1}\n',
+            content_type="application/x-ndjson")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["errors"], [
+            {"line": 1, "message": "question and answer must be text"},
+            {"line": 2, "message": "not valid UTF-8"},
+        ])
+
+        res = self.client().post(
+            "/questions/bulk",
+            data=b"question,answer,category,difficulty\n"
+                 b"Bulk question \xff?,Two,1,1\n"
+                 b"Bulk question two?,Two,1,1\n",
+            content_type="text/csv")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["errors"], [
+            {"line": 2, "message": "not valid UTF-8"}])
+
+    def test_export_questions_success(self):
+        res = self.client().get("/questions/export")
+        rows = [json.loads(line) for line in res.data.splitlines()]
+        total = json.loads(self.client().get("/questions").data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(len(rows), total["total_questions"])
+        self.assertEqual(sorted(rows[0]), [
+            "answer", "category", "difficulty", "id", "question"])
+
+    def test_update_question_success(self):
+        res = self.client().patch("/questions/5", json={"difficulty": 3})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["updated"], 5)
+        self.assertEqual(data["question"]["difficulty"], 3)
+
+    def test_update_question_failure(self):
+        res = self.client().patch("/questions/5", json={"difficulty": 10})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 422)
+
+    def test_update_question_invalid_body_failure(self):
+        res = self.client().patch("/questions/5", json={"question": 5})
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 422)
+
+        for body in (["x"], []):
+            res = self.client().patch("/questions/5", json=body)
+            data = json.loads(res.data)
+
+            self.assertEqual(data["success"], False)
+            self.assertEqual(data["error"], 400)
+
+    def test_update_missing_question_failure(self):
+        res = self.client().patch("/questions/1000", json={"difficulty": 3})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 404)
+
     """
     uncomment to test DELETE
     """
-    # def test_delete_question_success(self):
-    #     res = self.client().delete("/questions/30")
-    #     data = json.loads(res.data)
+    def test_delete_question_success(self):
+        res = self.client().delete("/questions/23")
+        data = json.loads(res.data)
 
-    #     self.assertEqual(res.status_code, 200)
-    #     self.assertEqual(data["success"], True)
-    #     self.assertTrue(data["deleted"])
-    #     self.assertTrue(len(data['questions']))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["deleted"])
+        self.assertTrue(data["total_questions"])
 
     def test_delete_question_failure(self):
         res = self.client().delete("/questions/1")
@@ -186,6 +643,18 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data_res["success"], True)
         self.assertTrue(data_res["question"])
 
+    def test_quizzes_with_question_texts_success(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [
+                "who discovered penicillin",
+                "What is the heaviest organ in the human body ?"],
+            "quiz_category": {"type": "Science", "id": 1}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["question"]["id"], 22)
+
     def test_quizzes_failure(self):
         res = self.client().post("/quizzes", data=json.dumps({
             "previous_questions": ["Who discovered penicillin?"],
@@ -200,6 +669,744 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data_res["success"], True)
         self.assertTrue(data_res["question"])
 
+    def test_quizzes_invalid_input_failure(self):
+        bodies = [
+            {"previous_questions": [None]},
+            {"previous_questions": [{"id": 21}]},
+            {"previous_questions": [True]},
+            {"previous_questions": "Who discovered penicillin?"},
+            {"previous_questions": [], "quiz_category": {"id": "science"}},
+            {"previous_questions": [], "quiz_category": {"id": [1]}},
+            {"previous_questions": [], "quiz_category": "Science"},
+            [21],
+        ]
+        for body in bodies:
+            res = self.client().post("/quizzes", json=body)
+            data_res = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data_res["success"], False, body)
+            self.assertEqual(data_res["error"], 400, body)
+
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [21],
+            "quiz_category": {"type": "Science", "id": "1"}})
+        self.assertEqual(json.loads(res.data)["success"], True)
+
+    def test_quizzes_with_question_ids_success(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [21],
+            "quiz_category": {
+                "type": "Science",
+                "id": 1
+            }
+        })
+        data_res = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data_res["success"], True)
+        self.assertNotEqual(data_res["question"]["id"], 21)
+
+    def test_quizzes_all_categories_success(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": {
+                "type": "click",
+                "id": 0
+            }
+        })
+        data_res = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data_res["success"], True)
+        self.assertTrue(data_res["question"])
+
+    def test_quizzes_with_difficulty_success(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": {"type": "click", "id": 0},
+            "difficulty": 1
+        })
+        data_res = json.loads(res.data)
+        question = Question.query.get(data_res["question"]["id"])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data_res["success"], True)
+        self.assertEqual(question.difficulty, 1)
+
+    def test_quizzes_with_difficulty_failure(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": {"type": "click", "id": 0},
+            "rating": "hard"
+        })
+        data_res = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data_res["success"], False)
+        self.assertEqual(data_res["error"], 400)
+
+    def test_quizzes_exhausted_category_failure(self):
+        res = self.client().post("/quizzes", json={
+            "previous_questions": [],
+            "quiz_category": {
+                "type": "Unknown",
+                "id": 1000
+            }
+        })
+        data_res = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data_res["success"], False)
+        self.assertEqual(data_res["error"], 404)
+
+    def test_quiz_session_success(self):
+        res = self.client().post("/quizzes/sessions", json={
+            "quiz_category": {"type": "Science", "id": 1}})
+        session = json.loads(res.data)
+
+        seen = []
+        for _ in range(session["total_questions"]):
+            res = self.client().post(
+                "/quizzes/sessions/{}/next".format(session["session_id"]))
+            data = json.loads(res.data)
+            seen.append(data["question"]["id"])
+
+        res = self.client().post(
+            "/quizzes/sessions/{}/next".format(session["session_id"]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["question"], None)
+        self.assertEqual(len(set(seen)), session["total_questions"])
+
+    def test_quiz_session_skips_deleted_questions(self):
+        res = self.client().post("/quizzes/sessions", json={
+            "quiz_category": {"type": "Science", "id": 1}})
+        session = json.loads(res.data)
+        url = "/quizzes/sessions/{}/next".format(session["session_id"])
+        self.client().delete("/questions/21")
+
+        seen = []
+        data = json.loads(self.client().post(url).data)
+        while data["question"] is not None:
+            seen.append(data["question"]["id"])
+            data = json.loads(self.client().post(url).data)
+
+        self.assertEqual(sorted(seen), [20, 22])
+        self.assertEqual(data["remaining"], 0)
+
+    def test_id_permutation_success(self):
+        for size in (1, 2, 3, 100, 1025):
+            order = IdPermutation(7, size)
+            self.assertEqual(sorted(order[i] for i in range(size)),
+                             list(range(size)))
+        self.assertNotEqual([IdPermutation(1, 100)[i] for i in range(100)],
+                            [IdPermutation(2, 100)[i] for i in range(100)])
+
+    def test_adaptive_quiz_session_success(self):
+        res = self.client().post("/quizzes/sessions", json={
+            "quiz_category": {"type": "Science", "id": 1}, "adaptive": True})
+        session = json.loads(res.data)
+        url = "/quizzes/sessions/{}/next".format(session["session_id"])
+
+        first = json.loads(self.client().post(url).data)
+        second = json.loads(self.client().post(url, json={"correct": True}).data)
+
+        self.assertEqual(session["rating"], 3.0)
+        self.assertEqual(second["success"], True)
+        self.assertEqual(second["rating"], session["rating"] + 0.5)
+        self.assertNotEqual(first["question"]["id"], second["question"]["id"])
+        self.assertEqual(second["remaining"], session["total_questions"] - 2)
+
+    def test_adaptive_quiz_rating_failure(self):
+        for rating in ("nan", "inf", 9):
+            res = self.client().post("/quizzes", json={
+                "previous_questions": [],
+                "quiz_category": {"type": "click", "id": 0},
+                "rating": rating})
+            self.assertEqual(json.loads(res.data)["error"], 400)
+
+            res = self.client().post("/quizzes/sessions", json={
+                "quiz_category": {"type": "click", "id": 0},
+                "rating": rating})
+            self.assertEqual(json.loads(res.data)["error"], 400)
+
+    def test_quiz_session_failure(self):
+        res = self.client().post("/quizzes/sessions/unknown/next")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 404)
+
+    def test_quiz_session_redis_store_success(self):
+        self.app.extensions["quiz_sessions"] = RedisSessionStore(FakeRedis())
+        res = self.client().post("/quizzes/sessions", json={
+            "quiz_category": {"type": "click", "id": 0}})
+        session = json.loads(res.data)
+
+        res = self.client().post(
+            "/quizzes/sessions/{}/next".format(session["session_id"]))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["question"])
+        self.assertEqual(data["remaining"], session["total_questions"] - 1)
+
+        res = self.client().post("/quizzes/sessions", json={
+            "quiz_category": {"type": "Science", "id": 1}})
+        url = "/quizzes/sessions/{}/next".format(
+            json.loads(res.data)["session_id"])
+        seen = [json.loads(self.client().post(url).data)["question"]["id"]
+                for _ in range(3)]
+        data = json.loads(self.client().post(url).data)
+
+        self.assertEqual(sorted(seen), [20, 21, 22])
+        self.assertEqual(data["question"], None)
+
+    def test_batch_success(self):
+        res = self.client().post("/batch", json={"requests": [
+            {"path": "/categories"},
+            {"path": "/questions?page=1&per_page=5"},
+            {"method": "GET", "path": "/questions/1000"},
+        ]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual([item["status"] for item in data["responses"]],
+                         [200, 200, 404])
+        self.assertTrue(data["responses"][0]["body"]["categories"])
+        self.assertEqual(len(data["responses"][1]["body"]["questions"]), 5)
+        self.assertEqual(data["responses"][2]["body"]["success"], False)
+
+    def test_batch_failure(self):
+        self.app.config["BATCH_MAX_REQUESTS"] = 2
+        res = self.client().post("/batch", json={
+            "requests": [{"path": "/categories"}] * 3})
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 400)
+
+        res = self.client().post("/batch", json={
+            "requests": [{"path": "/quizzes"}]})
+        data = json.loads(res.data)
+
+        self.assertEqual(data["responses"][0]["status"], 404)
+
+    def test_batch_body_failure(self):
+        for body in ([{"path": "/categories"}], "requests", None):
+            res = self.client().post("/batch", json=body)
+            data = json.loads(res.data)
+
+            self.assertEqual(data["success"], False)
+            self.assertEqual(data["error"], 400)
+
+    def test_near_duplicates_success(self):
+        self.app.config["DEDUPE_ENDPOINT"] = True
+        Question("What is the heaviest organ of the human body?",
+                 "The Liver", 1, 4).insert()
+        res = self.client().get("/internal/duplicates?threshold=0.8")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["pairs"][0]["ids"][0], 20)
+        self.assertGreaterEqual(data["pairs"][0]["similarity"], 0.8)
+
+    def test_near_duplicates_failure(self):
+        res = self.client().get("/internal/duplicates")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 404)
+
+        self.app.config["DEDUPE_ENDPOINT"] = True
+        for query in ("threshold=2", "category=abc"):
+            res = self.client().get("/internal/duplicates?" + query)
+            data = json.loads(res.data)
+
+            self.assertEqual(data["success"], False)
+            self.assertEqual(data["error"], 400)
+
+        # Each call costs a whole bucket.
+        self.app.config["RATE_LIMIT"] = 1
+        self.app.config["RATE_LIMIT_BURST"] = 50
+        self.client().get("/internal/duplicates")
+        res = self.client().get("/internal/duplicates")
+
+        self.assertEqual(res.status_code, 429)
+
+    def test_retrieve_changes_success(self):
+        version = json.loads(self.client().get("/changes").data)["version"]
+        question = Question("Which planet is the largest?", "Jupiter", 1, 2)
+        question.insert()
+        Question.query.get(23).delete()
+        self.client().post(
+            "/questions/bulk",
+            data=json.dumps({"question": "Bulk question one?",
+                             "answer": "One", "category": 1,
+                             "difficulty": 1}),
+            content_type="application/x-ndjson")
+        res = self.client().get("/changes?since={}".format(version))
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], True)
+        self.assertEqual([change["event"] for change in data["changes"]],
+                         ["insert", "delete", "reset"])
+        self.assertEqual(data["changes"][0]["question"]["id"], question.id)
+        self.assertEqual(data["changes"][1]["question"]["id"], 23)
+        self.assertEqual(data["version"], data["changes"][-1]["version"])
+        self.assertEqual(data["more"], False)
+
+    def test_retrieve_changes_failure(self):
+        res = self.client().get("/changes?since=latest")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 400)
+
+    def test_stream_changes_success(self):
+        self.app.config["CHANGES_STREAM_SECONDS"] = 0
+        version = QuestionChange.latest()
+        question = Question("Which planet is the largest?", "Jupiter", 1, 2)
+        question.insert()
+        res = self.client().get("/changes/stream",
+                                headers={"Last-Event-ID": str(version)})
+        events = res.get_data(as_text=True).split("\n\n")
+        res.close()
+
+        self.assertEqual(res.mimetype, "text/event-stream")
+        self.assertTrue(events[0].startswith("retry: "))
+        self.assertTrue(events[1].startswith(
+            "id: {}\nevent: insert\ndata: ".format(version + 1)))
+        self.assertEqual(json.loads(events[1].split("data: ")[1])
+                         ["question"]["id"], question.id)
+
+    def test_stream_changes_failure(self):
+        self.app.config["CHANGES_STREAM_SECONDS"] = 0
+        self.app.config["CHANGES_MAX_STREAMS"] = 1
+        first = self.client().get("/changes/stream", buffered=False)
+        res = self.client().get("/changes/stream")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data["error"], 503)
+        self.assertTrue(int(res.headers["Retry-After"]) >= 1)
+
+        first.close()
+        res = self.client().get("/changes/stream")
+        res.close()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.app.extensions["change_feed"]._streams, 0)
+
+    def test_stream_changes_from_follower_success(self):
+        # With a follower, streams take the changes it read instead of
+        # each reading the log.
+        self.app.config["CHANGES_STREAM_SECONDS"] = 0
+        feed = self.app.extensions["change_feed"]
+        feed.warm()
+        version = QuestionChange.latest()
+        question = Question("Which planet is the largest?", "Jupiter", 1, 2)
+        question.insert()
+        feed.catch_up()
+        with mock.patch.object(feed, "_following", return_value=True), \
+                mock.patch.object(feed, "since") as since:
+            res = self.client().get("/changes/stream",
+                                    headers={"Last-Event-ID": str(version)})
+            events = res.get_data(as_text=True).split("\n\n")
+            res.close()
+
+        since.assert_not_called()
+        self.assertTrue(events[1].startswith(
+            "id: {}\nevent: insert\ndata: ".format(version + 1)))
+        self.assertEqual(json.loads(events[1].split("data: ")[1])
+                         ["question"]["id"], question.id)
+
+    def test_change_feed_catch_up_success(self):
+        snapshot = self.app.extensions["question_snapshot"]
+        snapshot.load()
+        # written by another worker, which notified only its own caches
+        question = Question("Which planet is the largest?", "Jupiter", 1, 2)
+        db.session.add(question)
+        db.session.flush()
+        change = QuestionChange("insert", question.format())
+        change.origin = "another-worker"
+        db.session.add(change)
+        db.session.commit()
+        self.assertIsNone(snapshot.get(question.id))
+
+        self.assertEqual(self.app.extensions["change_feed"].catch_up(), 1)
+        self.assertEqual(snapshot.get(question.id)["answer"], "Jupiter")
+
+    def test_change_feed_catch_up_skips_own_changes(self):
+        Question("Which planet is the largest?", "Jupiter", 1, 2).insert()
+
+        self.assertEqual(self.app.extensions["change_feed"].catch_up(), 0)
+
+    def test_prune_changes_success(self):
+        version = QuestionChange.latest()
+        for answer in ("Jupiter", "Saturn", "Neptune"):
+            Question("Which planet is {}?".format(answer), answer, 1, 2).insert()
+        QuestionChange.prune(2)
+        data = json.loads(self.client().get(
+            "/changes?since={}".format(version)).data)
+
+        self.assertEqual([change["event"] for change in data["changes"]],
+                         ["reset", "insert"])
+        self.assertEqual(data["changes"][0]["question"], None)
+
+    def test_pool_statistics_success(self):
+        self.app.config["INTERNAL_ENDPOINTS"] = True
+        res = self.client().get("/internal/pool")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["pool"]["class"])
+        self.assertTrue(data["pool"]["status"])
+
+    def async_app(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = "sqlite:///" + os.path.join(directory.name, "trivia.db")
+        seed_database(database)
+        return create_async_app(database)
+
+    def test_async_app_success(self):
+        app = self.async_app()
+
+        async def scenario():
+            # Loaded at startup and reloaded in the background, not by
+            # the requests.
+            self.assertIsNotNone(app.quiz_ids)
+            self.assertFalse(app._refresher.done())
+            responses = {}
+            for path in ("/categories", "/questions?page=2",
+                         "/questions?per_page=5&fields=answer",
+                         "/categories/1/questions"):
+                responses[path] = await asgi_request(app, "GET", path)
+            cursor = responses["/questions?per_page=5&fields=answer"][1][
+                "next_cursor"]
+            responses["cursor"] = await asgi_request(
+                app, "GET", "/questions?per_page=5&cursor=" + cursor)
+            responses["quiz"] = await asgi_request(app, "POST", "/quizzes", {
+                "previous_questions": [20, "What is the heaviest organ in "
+                                           "the human body?"],
+                "quiz_category": {"type": "Science", "id": "1"}})
+            return responses
+
+        responses = asyncio.run(asgi_lifespan(app, scenario))
+        self.assertTrue(app._refresher.cancelled())
+
+        # Same bodies as the Flask app for the same fixtures.
+        for path in ("/categories", "/questions?page=2",
+                     "/questions?per_page=5&fields=answer",
+                     "/categories/1/questions"):
+            status, data = responses[path]
+            expected = json.loads(self.client().get(path).data)
+            self.assertEqual(status, 200)
+            self.assertEqual(data["success"], True)
+            for key in ("questions", "categories", "total_questions",
+                        "current_category", "next_cursor"):
+                self.assertEqual(data.get(key), expected.get(key), key)
+
+        self.assertEqual(set(responses["/questions?per_page=5&fields=answer"]
+                             [1]["questions"][0]), {"id", "answer"})
+        self.assertEqual(responses["cursor"][1]["questions"][0]["id"], 10)
+        quiz = responses["quiz"][1]["question"]
+        self.assertEqual(set(quiz), {"id", "question", "answer"})
+        self.assertIn(quiz["id"], {21, 22})
+
+    def test_async_app_failure(self):
+        app = self.async_app()
+
+        async def scenario():
+            # Without the lifespan protocol, quiz ids load on first use.
+            return [
+                await asgi_request(app, "GET", "/questions?page=1000"),
+                await asgi_request(app, "GET", "/questions?cursor=%21"),
+                await asgi_request(app, "GET", "/categories/1000/questions"),
+                await asgi_request(app, "DELETE", "/questions/1"),
+                await asgi_request(app, "POST", "/quizzes", {
+                    "previous_questions": [20, 21, 22],
+                    "quiz_category": {"type": "Science", "id": 1}}),
+                await asgi_request(app, "POST", "/quizzes", {
+                    "previous_questions": [], "rating": "nan"}),
+                await asgi_request(app, "POST", "/quizzes", {
+                    "previous_questions": [None],
+                    "quiz_category": {"id": "science"}}),
+            ]
+
+        responses = asyncio.run(scenario())
+        self.assertEqual([data["error"] for _, data in responses],
+                         [404, 400, 404, 404, 404, 400, 400])
+        for status, data in responses:
+            self.assertEqual(status, 200)
+            self.assertEqual(data["success"], False)
+
+    def test_replica_routing_success(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        replica = "sqlite:///" + os.path.join(directory.name, "replica.db")
+        engine = create_engine(replica)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO questions (id, question, answer, category, "
+                "difficulty) VALUES (1000, 'Only on the replica?', 'Yes', "
+                "NULL, 1)")
+        engine.dispose()
+        setup_replicas(self.app, [replica])
+        self.addCleanup(setup_replicas, self.app, [])
+
+        data = json.loads(self.client().get("/questions/1000").data)
+        self.assertEqual(data["question"]["answer"], "Yes")
+
+        # Within a read-your-writes window (e.g. after a write to another
+        # worker), reads skip the replica and the cached replica body.
+        until = "{:.3f}".format(time.time() + 5)
+        data = json.loads(self.client().get(
+            "/questions/1000", headers={"X-Read-Primary-Until": until}).data)
+        self.assertEqual(data["error"], 404)
+
+        res = self.client().post("/questions", json={
+            "question": "Written to the primary?", "answer": "Yes",
+            "category": 1, "difficulty": 1})
+        created = json.loads(res.data)["created"]
+        self.assertEqual(Question.query.get(created).answer, "Yes")
+        data = json.loads(self.client().get(
+            "/questions/{}".format(created), headers={
+                "X-Read-Primary-Until": res.headers["X-Read-Primary-Until"]
+            }).data)
+        self.assertEqual(data["question"]["answer"], "Yes")
+
+    def test_read_primary_window_failure(self):
+        # Searches and failed writes don't send clients to the primary.
+        res = self.client().post("/questions", json={"searchTerm": "Africa"})
+        self.assertNotIn("X-Read-Primary-Until", res.headers)
+
+        res = self.client().post("/questions", json={"question": ""})
+        self.assertEqual(json.loads(res.data)["error"], 422)
+        self.assertNotIn("X-Read-Primary-Until", res.headers)
+
+    def test_migrate_empty_database_success(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = "sqlite:///" + os.path.join(directory.name, "empty.db")
+        migrate(database)
+        engine = create_engine(database)
+        self.addCleanup(engine.dispose)
+        schema = inspect(engine)
+
+        self.assertEqual(current(engine), load_revisions()[-1].revision)
+        for table in db.metadata.sorted_tables:
+            columns = {column["name"]
+                       for column in schema.get_columns(table.name)}
+            self.assertLessEqual(set(table.columns.keys()), columns)
+
+    def test_migrate_downgrade_to_base_success(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        database = "sqlite:///" + os.path.join(directory.name, "empty.db")
+        migrate(database)
+        migrate(database, "base")
+        engine = create_engine(database)
+        self.addCleanup(engine.dispose)
+
+        self.assertEqual(current(engine), None)
+        self.assertNotIn("questions", inspect(engine).get_table_names())
+
+    def test_replica_set_round_robin_success(self):
+        replicas = ReplicaSet(["replica-1", "replica-2"])
+
+        self.assertEqual([replicas.choose() for _ in range(3)],
+                         ["replica-1", "replica-2", "replica-1"])
+
+    def test_replica_set_ejection_failure(self):
+        now = [0]
+        replicas = ReplicaSet(["replica-1", "replica-2"], retry=30,
+                              clock=lambda: now[0])
+        replicas.eject("replica-1")
+
+        self.assertEqual([replicas.choose() for _ in range(2)],
+                         ["replica-2", "replica-2"])
+        replicas.eject("replica-2")
+        self.assertEqual(replicas.choose(), None)
+        now[0] = 31
+        self.assertEqual(replicas.choose(), "replica-1")
+
+    def test_rate_limit_success(self):
+        self.app.config["RATE_LIMIT"] = 1
+        self.app.config["RATE_LIMIT_BURST"] = 5
+        res = self.client().get("/categories")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+
+    def test_rate_limit_create_cost_success(self):
+        # Only searches pay the search cost on POST /questions.
+        self.app.config["RATE_LIMIT"] = 1
+        self.app.config["RATE_LIMIT_BURST"] = 5
+        for number in range(3):
+            res = self.client().post("/questions", json={
+                "question": "Rate limited question {}?".format(number),
+                "answer": "Yes", "category": 1, "difficulty": 1})
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(json.loads(res.data)["success"], True)
+
+    def test_rate_limit_failure(self):
+        self.app.config["RATE_LIMIT"] = 1
+        self.app.config["RATE_LIMIT_BURST"] = 5
+        self.client().post("/questions", json={"searchTerm": "title"})
+        res = self.client().post("/questions", json={"searchTerm": "title"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 429)
+        self.assertTrue(int(res.headers["Retry-After"]) >= 1)
+
+    def test_rate_limit_api_key_success(self):
+        self.app.config["RATE_LIMIT"] = 1
+        self.app.config["RATE_LIMIT_BURST"] = 5
+        self.app.config["RATE_LIMIT_API_KEYS"] = {"known"}
+        self.client().post("/questions", json={"searchTerm": "title"})
+        res = self.client().post("/questions", json={"searchTerm": "title"},
+                                 headers={"X-API-Key": "known"})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_rate_limit_unknown_api_key_failure(self):
+        self.app.config["RATE_LIMIT"] = 1
+        self.app.config["RATE_LIMIT_BURST"] = 5
+        self.client().post("/questions", json={"searchTerm": "title"},
+                           headers={"X-API-Key": "made-up-1"})
+        res = self.client().post("/questions", json={"searchTerm": "title"},
+                                 headers={"X-API-Key": "made-up-2"})
+
+        self.assertEqual(res.status_code, 429)
+
+    def test_question_snapshot_success(self):
+        res = self.client().get("/categories/1/questions?per_page=2")
+        self.app.config["QUESTION_SNAPSHOT"] = True
+        self.app.config["INTERNAL_ENDPOINTS"] = True
+        snapshot_res = self.client().get("/categories/1/questions?per_page=2")
+        stats = json.loads(self.client().get("/internal/snapshot").data)
+
+        self.assertEqual(snapshot_res.status_code, 200)
+        self.assertEqual(json.loads(snapshot_res.data), json.loads(res.data))
+        self.assertTrue(stats["snapshot"]["rows"])
+        self.assertTrue(stats["snapshot"]["bytes_per_100k_questions"])
+
+    def test_question_snapshot_file_after_edit(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "questions.snapshot")
+        QuestionSnapshot(path=path).load()
+        self.client().patch("/questions/5", json={"answer": "Angelou"})
+
+        # a worker started after the edit
+        snapshot = QuestionSnapshot(path=path)
+        snapshot.load()
+
+        self.assertEqual(snapshot.get(5)["answer"], "Angelou")
+        self.assertFalse(snapshot.statistics()["mapped"])
+        unchanged = QuestionSnapshot(path=path)
+        unchanged.load()
+        self.assertTrue(unchanged.statistics()["mapped"])
+
+    def test_question_snapshot_failure(self):
+        self.app.config["QUESTION_SNAPSHOT"] = True
+        res = self.client().get("/questions/1000")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["error"], 404)
+        self.assertEqual(data["message"], "resource not found")
+
+    def test_failed_query_timing_failure(self):
+        # A failed statement leaves no start time on the connection.
+        with self.assertRaises(Exception):
+            db.session.execute(db.text("SELECT * FROM missing_table"))
+        db.session.rollback()
+
+        self.assertNotIn("query_started", db.session.connection().info)
+
+    def test_server_timing_header_success(self):
+        res = self.client().get("/questions?page=1")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("db;dur=", res.headers["Server-Timing"])
+        self.assertIn("total;dur=", res.headers["Server-Timing"])
+
+    def test_metrics_success(self):
+        self.app.config["INTERNAL_ENDPOINTS"] = True
+        self.client().get("/categories")
+        res = self.client().get("/metrics")
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_requests_total{endpoint="retrieve_categories"}',
+                      body)
+        self.assertIn("# TYPE trivia_db_queries_total counter", body)
+
+    def test_internal_endpoints_failure(self):
+        self.app.config["QUESTION_SNAPSHOT"] = True
+        for path in ("/internal/pool", "/internal/snapshot", "/metrics"):
+            data = json.loads(self.client().get(path).data)
+
+            self.assertEqual(data["success"], False, path)
+            self.assertEqual(data["error"], 404, path)
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_json_providers_success(self):
+        payload = {"b": [1, 2.5, None, True], "a": "Zoë",
+                   "c": {"z": 1, "y": 2}, "price": decimal.Decimal("1.10"),
+                   "html": HTMLText("<b>")}
+        expected = dict(payload, price="1.10", html="<b>")
+        for sort_keys in (True, False):
+            bodies = [provider(sort_keys=sort_keys).dumps(payload)
+                      for provider in (StdlibJSONProvider, OrjsonProvider)]
+
+            for body in bodies:
+                self.assertEqual(json.loads(body), expected)
+                keys = list(json.loads(body))
+                self.assertEqual(keys,
+                                 sorted(keys) if sort_keys else list(payload))
+
+    def test_json_providers_failure(self):
+        providers = [StdlibJSONProvider()]
+        if orjson is not None:
+            providers.append(OrjsonProvider())
+        for provider in providers:
+            with self.assertRaises(TypeError):
+                provider.dumps({"question": object()})
+
+        with self.assertRaises(TypeError):
+            jsonify({"success": True}, success=False)
+        self.assertEqual(json.loads(jsonify(1, 2).data), [1, 2])
+        self.assertEqual(json.loads(jsonify(success=True).data),
+                         {"success": True})
+
+    def test_get_questions_within_query_budget(self):
+        self.app.config["QUERY_BUDGET_STRICT"] = True
+        self.app.config["QUERY_BUDGETS"] = {
+            "retrieve_questions": 2,
+            "retrieve_question": 2,
+            "retrieve_categories": 0,
+        }
+
+        self.client().get("/questions?page=2")
+        self.client().get("/categories/1/questions")
+        self.client().get("/categories")
+
+    def test_query_budget_failure(self):
+        self.app.config["QUERY_BUDGET_STRICT"] = True
+        self.app.config["QUERY_BUDGETS"] = {"retrieve_questions": 0}
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get("/questions?page=3")
+
     def test_404_if_question_does_not_exist(self):
         res = self.client().delete("/questions/1000")
         data = json.loads(res.data)
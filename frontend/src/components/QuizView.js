@@ -44,8 +44,8 @@ class QuizView extends Component {
 
   getNextQuestion = () => {
     const previousQuestions = [...this.state.previousQuestions];
-    if (this.state.currentQuestion.question) {
-      previousQuestions.push(this.state.currentQuestion.question);
+    if (this.state.currentQuestion.id) {
+      previousQuestions.push(this.state.currentQuestion.id);
     }
 
     $.ajax({